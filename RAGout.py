@@ -1,448 +1,674 @@
 # llama-index-0.9.44
+#
+# Knowledge graph build and query strategy evaluation. Heavy dependencies
+# (llama_index, langchain, Gemini clients) are imported inside the functions
+# that use them and clients are built on first use, so each step of cli.py
+# only pays for what it runs.
 
-import os
 import gc
 import sys
-import json
 import time
-import random
+import shutil
 import logging
 import argparse
-import pandas as pd
-from utils import (
-    dataset_whole,
-    dataset_overlap,
-    dataset,
-)
-from tqdm import tqdm
+import itertools
+from collections import deque
 from pathlib import Path
-import google.generativeai
-from neo4j import exceptions
-from multiprocessing import Pool
-from llama_index.core import Settings
-from llama_index.llms.gemini import Gemini
-from IPython.display import Markdown, display
-from llama_index.core.schema import Node, Document
-from llama_index.core import load_index_from_storage
-from llama_index.graph_stores.neo4j import Neo4jGraphStore
-from llama_index.embeddings.gemini import GeminiEmbedding
-from llama_index.core.indices.knowledge_graph.base import (
-    KnowledgeGraphIndex,
-    StorageContext,
-)
-
-
-# Q&A
-from llama_index.core.query_engine import RetrieverQueryEngine
-from llama_index.core.retrievers import KnowledgeGraphRAGRetriever
-from llama_index.core.query_engine import KnowledgeGraphQueryEngine
-from llama_index.core.indices.loading import load_indices_from_storage
-from llama_index.core.evaluation import FaithfulnessEvaluator
-from langchain.chains import GraphCypherQAChain
-from langchain_community.graphs import Neo4jGraph
-from langchain_google_genai import ChatGoogleGenerativeAI
-
-logging.basicConfig(
-    stream=sys.stdout, level=logging.INFO
-)  # logging.DEBUG for more verbose output
-logging.getLogger().addHandler(logging.StreamHandler(stream=sys.stdout))
-
-
-llm = Gemini(model_name="models/gemini-1.0-pro", temperature=0.0)
-embedding_llm = GeminiEmbedding(model="models/embedding-001", temperature=0.0)
-cypher_model = ChatGoogleGenerativeAI(model="gemini-1.0-pro", temperature=0)
-qa_model = ChatGoogleGenerativeAI(model="gemini-1.0-pro", temperature=0)
-
-evaluator = FaithfulnessEvaluator(llm=llm)
+from functools import lru_cache
+
 
 DATABASE = "neo4j"
 USERNAME = "neo4j"
+CORPUS_FILE = "corpus.csv"
 
+edge_types, rel_prop_names = ["relationship"], ["relationship"]
+tags = ["entity"]
 
+parameters = [
+    (True, True, True),
+    (False, True, False),
+    (True, True, False),
+    (False, False, False),
+]
 
-# password = sys.argv[1]
-# url = sys.argv[2]
-# DB_ID = sys.argv[3]
-# overlap = int(sys.argv[4])
-# EXP_TAG = sys.argv[5]
-# CHUNK_SIZE = int(sys.argv[6])
-# MAX_TRIPLETS = int(sys.argv[7])
-
-# Setup the argument parser
-parser = argparse.ArgumentParser(description='Process some integers.')
-parser.add_argument('PASSWORD', type=str, help='Password for the database')
-parser.add_argument('URL', type=str, help='URL of the Neo4j database')
-parser.add_argument('DB_ID', type=str, help='Database ID')
-parser.add_argument('OVERLAP', type=int, help='Overlap value')
-parser.add_argument('EXP_TAG', type=str, help='Experiment tag')
-parser.add_argument('CHUNK_SIZE', type=int, help='Chunk size for processing')
-parser.add_argument('MAX_TRIPLETS', type=int, help='Maximum number of triplets')
-
-# Parse the arguments
-args = parser.parse_args()
-
-# Use the parsed arguments
-print(
-    "~ ",
-    args.PASSWORD,
-    args.URL,
-    args.DB_ID,
-    args.OVERLAP,
-    args.EXP_TAG,
-    args.CHUNK_SIZE,
-    args.MAX_TRIPLETS,
-)
-
-PASSWORD = args.PASSWORD
-URL = args.URL
-DB_ID = args.DB_ID
-OVERLAP = args.OVERLAP
-EXP_TAG = args.EXP_TAG
-CHUNK_SIZE = args.CHUNK_SIZE
-MAX_TRIPLETS = args.MAX_TRIPLETS
-# print(
-#     "~ ",
-#     PASSWORD,
-#     URL,
-#     DB_ID,
-#     OVERLAP,
-#     EXP_TAG,
-#     CHUNK_SIZE,
-#     MAX_TRIPLETS,
-# )
-STORAGE_PATH = f"./storage_graph_{DB_ID}_{EXP_TAG}_{MAX_TRIPLETS}__{CHUNK_SIZE}"
-SPACE_NAME = f"index_{DB_ID}_{EXP_TAG}_{MAX_TRIPLETS}__{CHUNK_SIZE}"
-
-TRIPLET_FILE = Path(
-    f"triplets_{DB_ID}_{EXP_TAG}_{MAX_TRIPLETS}__{CHUNK_SIZE}"
-).with_suffix(".csv")
-UNPROCESSED_FILE = Path(
-    f"unprocessed_{DB_ID}_{EXP_TAG}_{MAX_TRIPLETS}__{CHUNK_SIZE}"
-).with_suffix(".csv")
-try:
-    TRIPLET_FILE.unlink()
-except:
-    pass
-
-try:
-    UNPROCESSED_FILE.unlink()
-except:
-    pass
-
-TRIPLET_FILE.touch()
-UNPROCESSED_FILE.touch()
-
-with open(TRIPLET_FILE, "a") as fd:
-    fd.write("[\n")
-
-with open(UNPROCESSED_FILE, "a") as fd:
-    fd.write("[\n")
-
-graph = Neo4jGraph(url=URL, username=USERNAME, password=PASSWORD, database=DATABASE)
-
-print("space_name: ", SPACE_NAME)
-Settings.llm = llm
-Settings.embed_model = embedding_llm
-Settings.chunk_size = CHUNK_SIZE
+questions = [
+    "Tell me about the relationship between Vitamind D and Covid?",
+    "Qual é a relação entre a severidade, recuperação e infecção à COVID 19, insuficiência e deficiência de Vitamina D e o uso de protetor solar?",
+    "Descreva a relação direta ou indireta entre a severidade, recuperação e infecção à COVID 19, insuficiência e deficiência de Vitamina D e o uso de protetor solar trazendo referências bibliográficas conhecidas que suportem a resposta.",
+    "O que é deficiência de vitamina D?",
+    "O que é vitamina D e como ela pode interferir na recuperação da COVID-19?",
+    "Quem é Silvio Santos?",
+    "what is vitamin d insufficiency?",
+    "what is the ideal vitami D serum concentration for a human being?",
+    "what is vitamin d deficiency?",
+    "What is the relationship between the COVID-19 infection, Vitamin D insufficiency and deficiency?",
+    "What is the relationship between the severity, recovery, and COVID-19 infection, Vitamin D insufficiency and deficiency, and the use of sunscreen?",
+    "Trace the direct or indirect relationship between the severity, recovery, and COVID-19 infection, Vitamin D insufficiency and deficiency, and the use of sunscreen, bringing known bibliographic references that support the answer.",
+    "Who is Silvio Santos?",
+    "¿Qué es la insuficiencia de vitamina D?",
+    "¿Cuál es la concentración ideal de vitamina D en suero para un ser humano?",
+    "¿Qué es la deficiencia de vitamina D?",
+    "¿Cuál es la relación entre la infección por COVID-19, la insuficiencia y la deficiencia de vitamina D?",
+]
 
-edge_types, rel_prop_names = ["relationship"], ["relationship"]
-tags = ["entity"]
 
-graph_store = Neo4jGraphStore(
-    username=USERNAME, password=PASSWORD, url=URL, database=DATABASE
-)
-storage_context = StorageContext.from_defaults(graph_store=graph_store)
-df = pd.read_csv("corpus.csv")
-df["size"] = df["text"].str.len()
-
-docs = dataset_overlap(df, CHUNK_SIZE, OVERLAP)
-# docs = dataset_whole(df)
-print("nodes: ", len(docs))
-
-kg_index_f = KnowledgeGraphIndex.from_documents(
-    [],
-    storage_context=storage_context,
-    max_triplets_per_chunk=MAX_TRIPLETS,
-    space_name=SPACE_NAME,
-    edge_types=edge_types,
-    rel_prop_names=rel_prop_names,
-    tags=tags,
-    include_embeddings=True,
-    verbose=True,
-    timeout=100,
-)
-
-
-def extract_triplets(node):
-    for _ in range(5):
-        try:
-            triplets = kg_index_f._extract_triplets(node.text, node.metadata)
-            break
-        except:
-            time.sleep(0.3)
-    return list(set(triplets)), [node]
-
-
-def process_node(node):
-    # print("process_node: ", node)
-    triplets = []
-    try:
-        triplets, node = extract_triplets(node)
-        # return triplets
-    # except Exception as e:
-    except (exceptions.ServiceUnavailable, exceptions.TransientError) as e:
-        # print("->", e)
-        time.sleep(10)
-        triplets, node = extract_triplets(node)
-        # return triplets
-    except (
-        google.generativeai.types.generation_types.StopCandidateException,
-        google.generativeai.types.generation_types.BlockedPromptException,
-    ) as e:
-        nodes = node.split()
-        triplets = []
-        for n in nodes:
-            trplt = process_node(n)
-            triplets.extend(trplt)
+class Experiment:
+    """Parameters of an experiment and the names of the files it writes.
+
+    Its graph nodes get the ``node_label`` label, so experiments writing to
+    the same database with different labels don't share entities.
+    """
+
+    def __init__(
+        self,
+        password,
+        url,
+        db_id,
+        overlap,
+        exp_tag,
+        chunk_size,
+        max_triplets,
+        node_label="Entity",
+    ):
+        self.password = password
+        self.url = url
+        self.db_id = db_id
+        self.overlap = overlap
+        self.exp_tag = exp_tag
+        self.chunk_size = chunk_size
+        self.max_triplets = max_triplets
+        self.node_label = node_label
+
+        tag = f"{db_id}_{exp_tag}_{max_triplets}__{chunk_size}"
+        self.storage_path = f"./storage_graph_{tag}"
+        self.space_name = f"index_{tag}"
+        self.triplet_file = Path(f"triplets_{tag}").with_suffix(".jsonl")
+        self.unprocessed_file = Path(f"unprocessed_{tag}").with_suffix(".jsonl")
+        self.progress_file = Path(f"progress_{tag}").with_suffix(".txt")
+        # ANN index of the triplet embeddings, kept next to the index it
+        # was synced from
+        self.ann_path = Path(self.storage_path) / "ann"
+
+    def results_file(self, prefix, include_text, verbose, glob):
+        return (
+            f"{prefix}_{glob}_{verbose}_{self.db_id}__{include_text}_"
+            f"{self.chunk_size}_{self.max_triplets}_{self.overlap}.csv"
+        )
 
-    return triplets
 
+@lru_cache(maxsize=None)
+def get_llm():
+    from llama_index.llms.gemini import Gemini
 
-def split(node):
-    global df
-    global Settings
-    start = node.metadata.get("start")
-    end = node.metadata.get("end")
+    return Gemini(model_name="models/gemini-1.0-pro", temperature=0.0)
 
-    mid = start + (end - start) // 2
-    nodes = []
 
-    left_text = " ".join(df.iloc[start:mid, 2].tolist()).lower().strip()
-    right_text = " ".join(df.iloc[mid:end, 2].tolist()).lower().strip()
+@lru_cache(maxsize=None)
+def get_embedding_llm():
+    from embedding_cache import CachedEmbedding
+    from llama_index.embeddings.gemini import GeminiEmbedding
 
-    if len(left_text) > 0:
+    return CachedEmbedding(
+        GeminiEmbedding(model="models/embedding-001", temperature=0.0)
+    )
 
-        left_metadata = node.metadata.copy()
-        left_metadata.update(
-            {
-                "block_size": Settings.chunk_size,
-                "size": len(left_text) + 1,
-                "start": start,
-                "end": mid,
-            }
-        )
-        left_node = Document(text=left_text, metadata=left_metadata)
-        nodes.append(left_node)
-
-    if len(right_text) > 0:
-
-        right_metadata = node.metadata.copy()
-        right_metadata.update(
-            {
-                "block_size": Settings.chunk_size,
-                "size": len(right_text) + 1,
-                "start": mid + 1,
-                "end": end,
-            }
-        )
-        right_node = Document(text=right_text, metadata=right_metadata)
-        nodes.append(right_node)
-    gc.collect()
-    return nodes
 
+@lru_cache(maxsize=None)
+def get_chat_model(role):
+    """Gemini chat model of the Cypher chain, one per ``role``."""
+    from langchain_google_genai import ChatGoogleGenerativeAI
 
-setattr(Document, "split", split)
+    return ChatGoogleGenerativeAI(model="gemini-1.0-pro", temperature=0)
 
 
-def triplet_extractor(text, metadata):
+@lru_cache(maxsize=None)
+def setup_logging():
+    # once per process, so a sweep running several experiments in the same
+    # worker doesn't stack handlers
+    logging.basicConfig(
+        stream=sys.stdout, level=logging.INFO
+    )  # logging.DEBUG for more verbose output
+    logging.getLogger().addHandler(logging.StreamHandler(stream=sys.stdout))
 
-    unprocessed = []
-    triplets_list = []
-    doc = Document(text=text, metadata=metadata)
-    try:
-        triplets = process_node(doc)
-        tag = f'{metadata["source"]}__{metadata["start"]}__{metadata["end"]}'
-        triplets_list.append({"triplets": triplets, "id": tag})
-    except google.generativeai.types.generation_types.BlockedPromptException as e:
-        print(f"FAIL BlockedPromptException for {text}")
-        print(e)
-        unprocessed.append(metadata)
-        triplets = []
-    except google.generativeai.types.generation_types.StopCandidateException as e:
-        print(f"FAIL StopCandidateException for {text}")
-        print(e)
-        unprocessed.append(metadata)
-        triplets = []
-    except (exceptions.ServiceUnavailable, exceptions.TransientError) as e:
-        time.sleep(10)
-        # print(e)
-        triplets = process_node(doc)
-        tag = f'{metadata["source"]}__{metadata["start"]}__{metadata["end"]}'
-        triplets_list.append({"triplets": triplets, "id": tag})
-    except Exception as e:
-        print(f"FAIL Exception for {text}, \n{e}")
-        unprocessed.append(metadata)
-        print(e)
-        time.sleep(3)
-        triplets = []
 
-    with open(TRIPLET_FILE, "a") as fd:
-        for t in triplets_list:
-            json.dump(t, fd)
-            fd.write(",\n")
+def configure(exp):
+    from llama_index.core import Settings
 
-    with open(UNPROCESSED_FILE, "a") as fd:
-        for t in unprocessed:
-            json.dump(t, fd)
-            fd.write(",\n")
+    setup_logging()
+    print("space_name: ", exp.space_name)
+    Settings.llm = get_llm()
+    Settings.embed_model = get_embedding_llm()
+    Settings.chunk_size = exp.chunk_size
 
-    pbar.update(1)
-    gc.collect()
 
-    return triplets
+def get_storage_context(exp, persisted):
+    from schema_cache import with_schema_cache
+    from llama_index.core import StorageContext
+    from llama_index.graph_stores.neo4j import Neo4jGraphStore
 
+    graph_store = with_schema_cache(Neo4jGraphStore)(
+        username=USERNAME,
+        password=exp.password,
+        url=exp.url,
+        database=DATABASE,
+        node_label=exp.node_label,
+    )
+    return StorageContext.from_defaults(
+        graph_store=graph_store, persist_dir=exp.storage_path if persisted else None
+    )
 
-docs = docs[2947:2950]
-with tqdm(total=len(docs)) as pbar:
 
-    kg_index = KnowledgeGraphIndex.from_documents(
-        docs,
+def kg_params(exp, storage_context, **kwargs):
+    return dict(
         storage_context=storage_context,
-        max_triplets_per_chunk=MAX_TRIPLETS,
-        space_name=SPACE_NAME,
+        max_triplets_per_chunk=exp.max_triplets,
+        space_name=exp.space_name,
         edge_types=edge_types,
         rel_prop_names=rel_prop_names,
         tags=tags,
-        kg_triplet_extract_fn=triplet_extractor,
         include_embeddings=True,
         verbose=True,
         timeout=100,
+        **kwargs,
     )
 
-with open(TRIPLET_FILE, "a") as fd:
-    fd.write("]")
-
-with open(UNPROCESSED_FILE, "a") as fd:
-    fd.write("]")
 
-kg_index.storage_context.persist(persist_dir=STORAGE_PATH)
+def cached_triplets(kg_index, text, cache, limiter, model, max_triplets):
+    """Extracts the triplets of a text with the index's LLM, through the cache.
+
+    Args:
+        kg_index: Index whose extraction prompt and LLM are used. It must not
+            have a ``kg_triplet_extract_fn``.
+        text: The chunk text.
+        cache: The ``TripletCache``.
+        limiter: Rate limiter of the LLM calls.
+        model: Name of the extraction model.
+        max_triplets: Maximum number of triplets per chunk.
+
+    Returns:
+        The distinct triplets, in extraction order.
+    """
+    prompt = kg_index.kg_triple_extract_template.get_template()
+    triplets = cache.get(text, model, prompt, max_triplets)
+    if triplets is None:
+        triplets = limiter.call(kg_index._extract_triplets, text)
+        cache.put(text, model, prompt, max_triplets, triplets)
+    return list(dict.fromkeys(triplets))
+
+
+def build(exp, max_in_flight=8, restart=False, start=None, stop=None):
+    """Extracts triplets from the corpus and builds the knowledge graph index.
+
+    Args:
+        exp: The experiment.
+        max_in_flight: Maximum number of concurrent triplet extraction calls.
+        restart: Whether to discard the progress of a previous run.
+        start: Index of the first corpus chunk to process.
+        stop: Index after the last corpus chunk to process.
+
+    Returns:
+        The knowledge graph index.
+    """
+    import google.generativeai
+    from tqdm import tqdm
+    from utils import ordered_map
+    from corpus_store import open_corpus
+    from triplet_cache import TripletCache
+    from rate_limit import gemini_limiter, neo4j_limiter
+    from checkpoint import Checkpoint, chunk_id
+    from bisection import Bisector
+    from ann_index import IVFIndex
+    from llama_index.core import Settings, load_index_from_storage
+    from llama_index.core.schema import Document
+    from llama_index.core.ingestion import run_transformations
+    from llama_index.core.indices.knowledge_graph.base import KnowledgeGraphIndex
+
+    configure(exp)
+    llm = get_llm()
+    embedding_llm = get_embedding_llm()
+    GEMINI = gemini_limiter()
+    NEO4J = neo4j_limiter()
+
+    TRIPLET_CACHE = TripletCache("triplet_cache.sqlite")
+    CORPUS = open_corpus(CORPUS_FILE)
+    BISECTOR = Bisector(
+        CORPUS_FILE, "rejected_spans.jsonl", block_size=exp.chunk_size, store=CORPUS
+    )
 
+    # resume from the last committed chunk, unless asked not to or the index
+    # it was committed with is gone
+    RESUME = not restart and Path(exp.storage_path).exists()
+    CHECKPOINT = Checkpoint(
+        exp.progress_file,
+        {"triplets": exp.triplet_file, "unprocessed": exp.unprocessed_file},
+        resume=RESUME,
+    )
+    if not RESUME:
+        shutil.rmtree(exp.ann_path, ignore_errors=True)
+    ANN = IVFIndex(exp.ann_path)
 
-# kg_indexes = load_indices_from_storage(storage_context=storage_context)
+    storage_context = get_storage_context(exp, persisted=RESUME)
+    # Neo4j writes are retried one triplet at a time: retrying a whole
+    # kg_index.insert would transform the document again, with new node ids,
+    # after it had consumed part of EXTRACTED
+    graph_store = storage_context.graph_store
+    upsert_triplet = graph_store.upsert_triplet
 
+    def retried_upsert_triplet(subj, rel, obj):
+        return NEO4J.call(upsert_triplet, subj, rel, obj)
 
-parameters = [
-    (True, True, True),
-    (False, True, False),
-    (True, True, False),
-    (False, False, False),
-]
+    graph_store.upsert_triplet = retried_upsert_triplet
+    docs = CORPUS.overlap_documents(exp.chunk_size, exp.overlap)
 
+    kg_index_f = KnowledgeGraphIndex.from_documents([], **kg_params(exp, storage_context))
 
-for param in parameters:
-    INCLUDE_TEXT, VERBOSE, GLOBAL = param
-    strategy_query_engines = {}
+    def extract_triplets(node):
+        triplets = cached_triplets(
+            kg_index_f, node.text, TRIPLET_CACHE, GEMINI, llm.model, exp.max_triplets
+        )
+        return triplets, [node]
 
-    strategy_query_engines["vector_based"] = kg_index.as_query_engine()
+    def process_node(node, depth=0):
+        # print("process_node: ", node)
+        if BISECTOR.is_rejected(node.text):
+            return []
 
-    strategy_query_engines["keyword-based"] = kg_index.as_query_engine(
-        retriever_mode="keyword",
-        response_mode="tree_summarize",
-        verbose=VERBOSE,
-        include_text=INCLUDE_TEXT,
-        explore_global_knowledge=GLOBAL,
+        triplets = []
+        try:
+            triplets, node = extract_triplets(node)
+            # return triplets
+        except (
+            google.generativeai.types.generation_types.StopCandidateException,
+            google.generativeai.types.generation_types.BlockedPromptException,
+        ) as e:
+            if depth >= BISECTOR.max_depth:
+                BISECTOR.reject(node)
+                return []
+            nodes = BISECTOR.split(node)
+            if not nodes or (len(nodes) == 1 and nodes[0].text == node.text):
+                # nothing left to split
+                BISECTOR.reject(node)
+                return []
+            triplets = []
+            for n in nodes:
+                trplt = process_node(n, depth + 1)
+                triplets.extend(trplt)
+
+        return triplets
+
+    def extract_chunk(text, metadata):
+
+        unprocessed = []
+        triplets_list = []
+        doc = Document(text=text, metadata=metadata)
+        try:
+            triplets = process_node(doc)
+            triplets_list.append({"triplets": triplets, "id": chunk_id(metadata)})
+        except google.generativeai.types.generation_types.BlockedPromptException as e:
+            print(f"FAIL BlockedPromptException for {text}")
+            print(e)
+            unprocessed.append(metadata)
+            triplets = []
+        except google.generativeai.types.generation_types.StopCandidateException as e:
+            print(f"FAIL StopCandidateException for {text}")
+            print(e)
+            unprocessed.append(metadata)
+            triplets = []
+        except Exception as e:
+            # raised once the GEMINI retry policy has given up
+            print(f"FAIL Exception for {text}, \n{e}")
+            unprocessed.append(metadata)
+            print(e)
+            triplets = []
+
+        return triplets, triplets_list, unprocessed
+
+    def extract_document(doc):
+        # same transformations as kg_index.insert, so node texts match
+        nodes = run_transformations([doc], Settings.transformations)
+        results = [extract_chunk(n.text, n.metadata) for n in nodes]
+
+        # embed the triplets here, in batches, so kg_index.insert only reads
+        # them back from the embedding cache
+        triplet_texts = [str(t) for triplets, _, _ in results for t in triplets]
+        if triplet_texts:
+            try:
+                GEMINI.call(embedding_llm.get_text_embedding_batch, triplet_texts)
+            except Exception as e:
+                print(f"FAIL embedding batch, \n{e}")
+        return doc, nodes, results
+
+    # (node text, triplets) of the document being inserted, in node order.
+    # kg_index.insert runs the same transformations and extracts from the
+    # nodes in order, but passes their content with a metadata header.
+    EXTRACTED = deque()
+    # triplets upserted by the insert in progress, added to the ANN index
+    # right after it
+    INSERTED = []
+
+    def triplet_extractor(text):
+        triplets = None
+        if EXTRACTED:
+            node_text, triplets = EXTRACTED.popleft()
+            if node_text not in text:
+                EXTRACTED.clear()
+                triplets = None
+        if triplets is None:
+            # not aligned with extract_document's nodes, extract it here
+            triplets = cached_triplets(
+                kg_index_f, text, TRIPLET_CACHE, GEMINI, llm.model, exp.max_triplets
+            )
+        INSERTED.extend(str(t) for t in triplets)
+        return triplets
+
+    # chunks left uncommitted because an extraction failed
+    FAILED = []
+
+    docs = itertools.islice(docs, start, stop)
+    docs = (doc for doc in docs if chunk_id(doc.metadata) not in CHECKPOINT.done)
+    print("resuming after: ", len(CHECKPOINT.done))
+
+    with tqdm() as pbar:
+
+        params = kg_params(exp, storage_context, kg_triplet_extract_fn=triplet_extractor)
+        if RESUME:
+            kg_index = load_index_from_storage(index_id=exp.space_name, **params)
+        else:
+            kg_index = KnowledgeGraphIndex.from_documents([], **params)
+            kg_index.set_index_id(exp.space_name)
+        # chunks are extracted concurrently, up to max_in_flight at a time,
+        # and recorded and upserted in corpus order
+        for doc, nodes, results in ordered_map(extract_document, docs, max_in_flight):
+            for triplets, triplets_list, unprocessed in results:
+                for t in triplets_list:
+                    CHECKPOINT.write("triplets", t)
+                for t in unprocessed:
+                    CHECKPOINT.write("unprocessed", {"id": chunk_id(t), **t})
+
+                pbar.update(1)
+
+            # a chunk with a failed extraction (as opposed to a span rejected
+            # by the bisector, which yields no triplets but no failure) is
+            # neither inserted nor committed, so the next run extracts and
+            # inserts it once
+            if any(unprocessed for _, _, unprocessed in results):
+                FAILED.append(chunk_id(doc.metadata))
+                continue
+
+            EXTRACTED.extend(
+                (node.text, triplets) for node, (triplets, _, _) in zip(nodes, results)
+            )
+            kg_index.insert(doc)
+            EXTRACTED.clear()
+            embedding_dict = kg_index.index_struct.embedding_dict
+            inserted = [t for t in dict.fromkeys(INSERTED) if t in embedding_dict]
+            ANN.add(inserted, [embedding_dict[t] for t in inserted])
+            INSERTED.clear()
+            gc.collect()
+
+            # the index is persisted before the chunks are committed, so a
+            # committed chunk is always in the persisted index
+            if CHECKPOINT.mark(chunk_id(doc.metadata)):
+                kg_index.storage_context.persist(persist_dir=exp.storage_path)
+                ANN.save()
+                CHECKPOINT.commit()
+
+    kg_index.storage_context.persist(persist_dir=exp.storage_path)
+    ANN.save()
+    CHECKPOINT.close()
+    if FAILED:
+        print(f"failed chunks, retried on the next run: {len(FAILED)}")
+    print("rate limits: ", GEMINI.report(), NEO4J.report())
+    return kg_index
+
+
+def load(exp):
+    """Loads the persisted knowledge graph index of an experiment."""
+    from llama_index.core import load_index_from_storage
+
+    if not Path(exp.storage_path).exists():
+        raise FileNotFoundError(f"{exp.storage_path} not found, run build first.")
+    storage_context = get_storage_context(exp, persisted=True)
+    return load_index_from_storage(
+        index_id=exp.space_name, **kg_params(exp, storage_context)
     )
 
-    strategy_query_engines["hybrid"] = kg_index.as_query_engine(
-        include_text=True,
-        response_mode="tree_summarize",
-        embedding_mode="hybrid",
-        similarity_top_k=3,
-        verbose=VERBOSE,
-        explore_global_knowledge=GLOBAL,
-    )
 
-    graph_rag_retriever = KnowledgeGraphRAGRetriever(
-        storage_context=storage_context,
-        synonym_expand_policy="union",
-        max_synonyms=5,
-        retriever_mode="semantic",
-        verbose=VERBOSE,
-        include_text=INCLUDE_TEXT,
-        explore_global_knowledge=GLOBAL,
+def evaluate(exp, kg_index=None, concurrency=1, warmup=1, max_in_flight=8):
+    """Benchmarks the query strategies and scores their answers.
+
+    Args:
+        exp: The experiment.
+        kg_index: The index, loaded from ``exp.storage_path`` if None.
+        concurrency: Number of concurrent questions per query strategy.
+        warmup: Number of untimed warm-up questions per query strategy.
+        max_in_flight: Maximum number of concurrent evaluator calls.
+    """
+    import pandas as pd
+    from rate_limit import gemini_limiter, neo4j_limiter
+    from benchmark import run_benchmark
+    from evaluation import EvalCache, answer_contexts, evaluate_results
+    from ann_index import IVFIndex, as_ann_query_engine
+    from cypher_cache import CypherCache, CachedGraphCypherQAChain
+    from schema_cache import with_schema_cache
+    from llama_index.core.query_engine import RetrieverQueryEngine
+    from llama_index.core.retrievers import KnowledgeGraphRAGRetriever
+    from llama_index.core.query_engine import KnowledgeGraphQueryEngine
+    from llama_index.core.evaluation import FaithfulnessEvaluator
+    from langchain_community.graphs import Neo4jGraph
+
+    configure(exp)
+    if kg_index is None:
+        kg_index = load(exp)
+    storage_context = kg_index.storage_context
+    llm = get_llm()
+    evaluator = FaithfulnessEvaluator(llm=llm)
+    GEMINI = gemini_limiter()
+    NEO4J = neo4j_limiter()
+    CYPHER_CACHE = CypherCache("cypher_cache.sqlite")
+    EVAL_CACHE = EvalCache("eval_cache.sqlite")
+
+    ANN = IVFIndex(exp.ann_path)
+    ANN.sync(kg_index.index_struct.embedding_dict)
+    ANN.save()
+    print(f"ANN recall@10: {ANN.recall(10):.3f} (nprobe {ANN.nprobe})")
+
+    graph = with_schema_cache(Neo4jGraph)(
+        url=exp.url, username=USERNAME, password=exp.password, database=DATABASE
     )
-    strategy_query_engines["rag"] = RetrieverQueryEngine.from_args(graph_rag_retriever)
 
-    strategy_query_engines["graph"] = KnowledgeGraphQueryEngine(
-        storage_context=storage_context,
-        llm=llm,
-        refresh_schema=True,
-        verbose=VERBOSE,
-        include_text=INCLUDE_TEXT,
-        explore_global_knowledge=GLOBAL,
+    t1 = time.time()
+    for param in parameters:
+        INCLUDE_TEXT, VERBOSE, GLOBAL = param
+        strategy_query_engines = {}
+
+        strategy_query_engines["vector_based"] = as_ann_query_engine(kg_index, ANN)
+
+        strategy_query_engines["keyword-based"] = kg_index.as_query_engine(
+            retriever_mode="keyword",
+            response_mode="tree_summarize",
+            verbose=VERBOSE,
+            include_text=INCLUDE_TEXT,
+            explore_global_knowledge=GLOBAL,
+        )
+
+        strategy_query_engines["hybrid"] = as_ann_query_engine(
+            kg_index,
+            ANN,
+            include_text=True,
+            response_mode="tree_summarize",
+            embedding_mode="hybrid",
+            similarity_top_k=3,
+            verbose=VERBOSE,
+            explore_global_knowledge=GLOBAL,
+        )
+
+        graph_rag_retriever = KnowledgeGraphRAGRetriever(
+            storage_context=storage_context,
+            synonym_expand_policy="union",
+            max_synonyms=5,
+            retriever_mode="semantic",
+            verbose=VERBOSE,
+            include_text=INCLUDE_TEXT,
+            explore_global_knowledge=GLOBAL,
+        )
+        strategy_query_engines["rag"] = RetrieverQueryEngine.from_args(
+            graph_rag_retriever
+        )
+
+        strategy_query_engines["graph"] = KnowledgeGraphQueryEngine(
+            storage_context=storage_context,
+            llm=llm,
+            refresh_schema=True,
+            verbose=VERBOSE,
+            include_text=INCLUDE_TEXT,
+            explore_global_knowledge=GLOBAL,
+        )
+        strategy_query_engines["chain"] = CachedGraphCypherQAChain.from_llm(
+            graph=graph,
+            cypher_llm=get_chat_model("cypher"),
+            qa_llm=get_chat_model("qa"),
+            validate_cypher=True,
+            # the query results are the contexts its answers are judged on
+            return_intermediate_steps=True,
+            verbose=VERBOSE,
+            cypher_cache=CYPHER_CACHE,
+            # the experiments of a sweep share db_id but not the database
+            cache_scope=f"{exp.url}/{exp.node_label}",
+        )
+
+        answers_map = []
+
+        engines = {(exp.db_id, name): stg for name, stg in strategy_query_engines.items()}
+        results, summary = run_benchmark(
+            engines,
+            questions,
+            concurrency=concurrency,
+            warmup=warmup,
+            call=GEMINI.call,
+        )
+        summary.to_csv(
+            exp.results_file("benchmark", INCLUDE_TEXT, VERBOSE, GLOBAL), index=None
+        )
+        print(summary)
+
+        scores = evaluate_results(
+            evaluator,
+            llm.model,
+            results,
+            cache=EVAL_CACHE,
+            max_in_flight=max_in_flight,
+            call=GEMINI.call,
+        )
+        for result, fact_score in zip(results, scores):
+            if result["error"] is not None:
+                print("-- ", result["strategy"], result["error"])
+                continue
+            if isinstance(fact_score, Exception):
+                print("-- ", result["strategy"])
+                print(fact_score)
+                continue
+            response = result["response"]
+            answer = {
+                "db": result["db"],
+                "strategy": result["strategy"],
+                "question": result["question"],
+                "answer": answer_contexts(response)[0],
+                "answer_context": response,
+                "eval": fact_score["score"],
+                "eval_context": "\n".join(fact_score["contexts"]),
+                "time": result["time"],
+            }
+            answers_map.append(answer)
+
+        pd.DataFrame(answers_map).to_csv(
+            exp.results_file("qa", INCLUDE_TEXT, VERBOSE, GLOBAL), index=None
+        )
+
+    print("elapsed: ", time.time() - t1)
+    print("rate limits: ", GEMINI.report(), NEO4J.report())
+
+
+def add_run_arguments(parser, build=True, evaluate=True):
+    parser.add_argument(
+        '--max-in-flight',
+        dest='MAX_IN_FLIGHT',
+        type=int,
+        default=8,
+        help='Maximum number of concurrent triplet extraction and evaluation calls',
+    )
+    if evaluate:
+        add_evaluate_arguments(parser)
+    if build:
+        add_build_arguments(parser)
+
+
+def add_evaluate_arguments(parser):
+    parser.add_argument(
+        '--concurrency',
+        dest='CONCURRENCY',
+        type=int,
+        default=1,
+        help='Number of concurrent questions per query strategy',
     )
-    strategy_query_engines["chain"] = GraphCypherQAChain.from_llm(
-        graph=graph,
-        cypher_llm=cypher_model,
-        qa_llm=qa_model,
-        validate_cypher=True,
-        return_intermediate_steps=INCLUDE_TEXT,
-        verbose=VERBOSE,
+    parser.add_argument(
+        '--warmup',
+        dest='WARMUP',
+        type=int,
+        default=1,
+        help='Number of untimed warm-up questions per query strategy',
     )
 
-    questions = [
-        "Tell me about the relationship between Vitamind D and Covid?",
-        "Qual é a relação entre a severidade, recuperação e infecção à COVID 19, insuficiência e deficiência de Vitamina D e o uso de protetor solar?",
-        "Descreva a relação direta ou indireta entre a severidade, recuperação e infecção à COVID 19, insuficiência e deficiência de Vitamina D e o uso de protetor solar trazendo referências bibliográficas conhecidas que suportem a resposta.",
-        "O que é deficiência de vitamina D?",
-        "O que é vitamina D e como ela pode interferir na recuperação da COVID-19?",
-        "Quem é Silvio Santos?",
-        "what is vitamin d insufficiency?",
-        "what is the ideal vitami D serum concentration for a human being?",
-        "what is vitamin d deficiency?",
-        "What is the relationship between the COVID-19 infection, Vitamin D insufficiency and deficiency?",
-        "What is the relationship between the severity, recovery, and COVID-19 infection, Vitamin D insufficiency and deficiency, and the use of sunscreen?",
-        "Trace the direct or indirect relationship between the severity, recovery, and COVID-19 infection, Vitamin D insufficiency and deficiency, and the use of sunscreen, bringing known bibliographic references that support the answer.",
-        "Who is Silvio Santos?",
-        "¿Qué es la insuficiencia de vitamina D?",
-        "¿Cuál es la concentración ideal de vitamina D en suero para un ser humano?",
-        "¿Qué es la deficiencia de vitamina D?",
-        "¿Cuál es la relación entre la infección por COVID-19, la insuficiencia y la deficiencia de vitamina D?",
-    ]
-
-    answers_map = []
-    t1 = time.time()
 
-    for stg_name, stg in strategy_query_engines.items():
+def add_build_arguments(parser):
+    parser.add_argument(
+        '--restart',
+        dest='RESTART',
+        action='store_true',
+        help='Discard the progress of a previous run instead of resuming it',
+    )
+    parser.add_argument(
+        '--start', dest='START', type=int, default=2947, help='First corpus chunk'
+    )
+    parser.add_argument(
+        '--stop', dest='STOP', type=int, default=2950, help='Corpus chunk after the last one'
+    )
 
-        q_id = 0
 
-        while q_id < len(questions):
-            question = questions[q_id]
-            try:
-                tic = time.time()
-                response = stg.query(question)
-                tac = time.time() - tic
-                fact_score = evaluator.evaluate_response(response=response)
-                answer = {
-                    "db": DB_ID,
-                    "strategy": stg_name,
-                    "question": question,
-                    "answer": response.response,
-                    "answer_context": response,
-                    "eval": fact_score.score,
-                    "eval_context": "\n".join(fact_score.contexts),
-                    "time": tac,
-                }
-                answers_map.append(answer)
-                q_id += 1
-            except Exception as e:
-                print("-- ", stg_name, stg)
-                print(e)
-                # time.sleep(random.randint(5, 25))
-
-pd.DataFrame(answers_map).to_csv(
-    f"qa_{GLOBAL}_{VERBOSE}_{DB_ID}__{INCLUDE_TEXT}_{CHUNK_SIZE}_{MAX_TRIPLETS}_{OVERLAP}.csv",
-    index=None,
-)
-print("elapsed: ", time.time() - t1)
+if __name__ == "__main__":
+    # Setup the argument parser
+    parser = argparse.ArgumentParser(description='Build and evaluate a knowledge graph.')
+    parser.add_argument('PASSWORD', type=str, help='Password for the database')
+    parser.add_argument('URL', type=str, help='URL of the Neo4j database')
+    parser.add_argument('DB_ID', type=str, help='Database ID')
+    parser.add_argument('OVERLAP', type=int, help='Overlap value')
+    parser.add_argument('EXP_TAG', type=str, help='Experiment tag')
+    parser.add_argument('CHUNK_SIZE', type=int, help='Chunk size for processing')
+    parser.add_argument('MAX_TRIPLETS', type=int, help='Maximum number of triplets')
+    add_run_arguments(parser)
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    # Use the parsed arguments
+    print(
+        "~ ",
+        args.URL,
+        args.DB_ID,
+        args.OVERLAP,
+        args.EXP_TAG,
+        args.CHUNK_SIZE,
+        args.MAX_TRIPLETS,
+    )
+
+    exp = Experiment(
+        args.PASSWORD,
+        args.URL,
+        args.DB_ID,
+        args.OVERLAP,
+        args.EXP_TAG,
+        args.CHUNK_SIZE,
+        args.MAX_TRIPLETS,
+    )
+    kg_index = build(exp, args.MAX_IN_FLIGHT, args.RESTART, args.START, args.STOP)
+    evaluate(exp, kg_index, args.CONCURRENCY, args.WARMUP, args.MAX_IN_FLIGHT)
@@ -0,0 +1,271 @@
+import os
+import json
+import copy
+import numpy as np
+from pathlib import Path
+from llama_index.core import Settings
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.indices.knowledge_graph.retrievers import (
+    KGRetrieverMode,
+    KGTableRetriever,
+)
+
+
+class IVFIndex:
+    """Inverted-file approximate nearest neighbour index, built on NumPy.
+
+    Vectors are L2-normalized, so inner products are cosine similarities,
+    and appended to a raw float32 file that is memory-mapped for search.
+    Each vector is assigned to its nearest k-means centroid, and a search
+    only scores the vectors of the ``nprobe`` centroids closest to the
+    query. Inserts are incremental: new vectors go to their nearest
+    existing centroid, and the centroids are retrained once the index has
+    grown ``retrain_factor`` times since they were last trained. The number
+    of centroids grows with the index, so after every training the number
+    searched is doubled, from ``nprobe``, until the estimated recall@10
+    reaches ``target_recall``.
+
+    Files (``vectors.f32``, ``assign.i32``, ``texts.jsonl``,
+    ``centroids.npy`` and ``meta.json``) are kept in ``path``. Only
+    ``meta.json`` is rewritten by ``save``, and rows past its count are
+    ignored, so an interrupted run leaves a consistent index.
+
+    Args:
+        path: Index directory.
+        nprobe: Minimum number of centroids searched per query.
+        target_recall: Recall@10 the number of centroids searched is tuned to.
+        min_train: Size below which the index is searched exhaustively.
+        retrain_factor: Growth that triggers retraining.
+    """
+
+    def __init__(self, path, nprobe=8, target_recall=0.95, min_train=4096, retrain_factor=4):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.min_nprobe = nprobe
+        self.target_recall = target_recall
+        self.min_train = min_train
+        self.retrain_factor = retrain_factor
+
+        meta_path = self.path / "meta.json"
+        meta = json.loads(meta_path.read_text()) if meta_path.exists() else {}
+        self.dim = meta.get("dim")
+        self.count = meta.get("count", 0)
+        self.trained = meta.get("trained", 0)
+        self.nprobe = meta.get("nprobe", nprobe)
+
+        self.texts = []
+        if self.count:
+            with open(self.path / "texts.jsonl", encoding="utf-8") as fd:
+                lines = fd.readlines()
+            self.texts = [json.loads(line) for line in lines[: self.count]]
+            if len(lines) > self.count:
+                # drop the texts added after the last save
+                with open(self.path / "texts.jsonl", "w", encoding="utf-8") as fd:
+                    fd.writelines(lines[: self.count])
+        self.ids = set(self.texts)
+        self.vectors = None
+        self.mapped = 0
+
+        self.centroids = None
+        self.lists = []
+        if self.trained:
+            self.centroids = np.load(self.path / "centroids.npy")
+            assign = np.fromfile(self.path / "assign.i32", dtype=np.int32)[: self.count]
+            self._build_lists(assign)
+
+    def __len__(self):
+        return self.count
+
+    def _build_lists(self, assign):
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(len(self.centroids) + 1))
+        self.lists = [order[bounds[c] : bounds[c + 1]].tolist() for c in range(len(self.centroids))]
+
+    def _map(self):
+        if self.vectors is None or self.mapped != self.count:
+            self.vectors = np.memmap(
+                self.path / "vectors.f32", dtype=np.float32, mode="r", shape=(self.count, self.dim)
+            )
+            self.mapped = self.count
+        return self.vectors
+
+    def _assign(self, vectors):
+        return np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+    def _train(self, iterations=10, seed=0):
+        vectors = self._map()
+        n_centroids = int(np.clip(np.sqrt(self.count), 16, 4096))
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(self.count, min(self.count, 64 * n_centroids), replace=False))
+        sample = np.asarray(vectors[sample])
+        centroids = sample[rng.choice(len(sample), n_centroids, replace=False)]
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(n_centroids):
+                members = sample[labels == c]
+                if len(members):
+                    mean = members.mean(axis=0)
+                    centroids[c] = mean / (np.linalg.norm(mean) or 1.0)
+        self.centroids = centroids.astype(np.float32)
+
+        assign = np.concatenate(
+            [self._assign(np.asarray(vectors[i : i + 65536])) for i in range(0, self.count, 65536)]
+        )
+        tmp = self.path / "assign.i32.tmp"
+        assign.tofile(tmp)
+        os.replace(tmp, self.path / "assign.i32")
+        np.save(self.path / "centroids.npy", self.centroids)
+        self.trained = self.count
+        self._build_lists(assign)
+        self._tune()
+
+    def _tune(self, k=10):
+        self.nprobe = self.min_nprobe
+        exact = self._exact(k)
+        while self.nprobe < len(self.centroids) and self.recall(k, exact=exact) < self.target_recall:
+            self.nprobe = min(len(self.centroids), 2 * self.nprobe)
+
+    def add(self, texts, vectors):
+        """Adds the vectors of texts that are not indexed yet."""
+        new = [(t, v) for t, v in zip(texts, vectors) if t not in self.ids]
+        if not new:
+            return
+        texts = [t for t, _ in new]
+        vectors = np.asarray([v for _, v in new], dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        self.dim = self.dim or vectors.shape[1]
+
+        with open(self.path / "vectors.f32", "r+b" if self.count else "wb") as fd:
+            fd.seek(self.count * self.dim * 4)
+            vectors.tofile(fd)
+        with open(self.path / "texts.jsonl", "a", encoding="utf-8") as fd:
+            for text in texts:
+                fd.write(json.dumps(text) + "\n")
+        if self.centroids is not None:
+            assign = self._assign(vectors)
+            with open(self.path / "assign.i32", "r+b") as fd:
+                fd.seek(self.count * 4)
+                assign.tofile(fd)
+            for row, c in enumerate(assign, self.count):
+                self.lists[c].append(row)
+
+        self.texts.extend(texts)
+        self.ids.update(texts)
+        self.count += len(texts)
+
+        if self.count >= self.min_train and self.count >= self.retrain_factor * max(self.trained, 1):
+            self._train()
+
+    def sync(self, embedding_dict):
+        """Adds the entries of a KG ``embedding_dict`` missing from the index."""
+        missing = [text for text in embedding_dict if text not in self.ids]
+        self.add(missing, [embedding_dict[text] for text in missing])
+
+    def save(self):
+        meta = {"dim": self.dim, "count": self.count, "trained": self.trained, "nprobe": self.nprobe}
+        (self.path / "vectors.f32").touch()
+        tmp = self.path / "meta.json.tmp"
+        tmp.write_text(json.dumps(meta))
+        os.replace(tmp, self.path / "meta.json")
+
+    def search(self, query, k):
+        """Returns the ``k`` most similar texts with their normalized vectors."""
+        if not self.count:
+            return {}
+        query = np.asarray(query, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        vectors = self._map()
+
+        if self.centroids is None:
+            candidates = np.arange(self.count)
+        else:
+            probes = np.argsort(-(self.centroids @ query))[: self.nprobe]
+            candidates = np.fromiter(
+                (row for c in probes for row in self.lists[c]), dtype=np.int64
+            )
+        if not len(candidates):
+            return {}
+        scores = np.asarray(vectors[candidates]) @ query
+        top = candidates[np.argsort(-scores)[:k]]
+        return {self.texts[i]: vectors[i].tolist() for i in top}
+
+    def _exact(self, k, samples=100, seed=0):
+        # sampled indexed vectors and their exhaustive top k, scanning the
+        # vectors once
+        vectors = self._map()
+        rng = np.random.default_rng(seed)
+        rows = np.sort(rng.choice(self.count, min(samples, self.count), replace=False))
+        queries = np.asarray(vectors[rows])
+        k = min(k, self.count)
+        best = np.full((k, len(rows)), -np.inf, dtype=np.float32)
+        exact = np.zeros((k, len(rows)), dtype=np.int64)
+        for i in range(0, self.count, 65536):
+            block = np.asarray(vectors[i : i + 65536]) @ queries.T
+            scores = np.concatenate([best, block])
+            ids = np.concatenate(
+                [exact, np.broadcast_to(np.arange(i, i + len(block))[:, None], block.shape)]
+            )
+            top = np.argpartition(-scores, k - 1, axis=0)[:k]
+            best = np.take_along_axis(scores, top, axis=0)
+            exact = np.take_along_axis(ids, top, axis=0)
+        return queries, exact.T
+
+    def recall(self, k=10, exact=None):
+        """Estimates the recall@k of ``search`` against an exhaustive search.
+
+        Indexed vectors, sampled at random, are used as queries.
+        """
+        if not self.count:
+            return float("nan")
+        queries, exact = exact or self._exact(k)
+        hits = 0
+        for query, rows in zip(queries, exact):
+            found = self.search(query, k)
+            hits += sum(self.texts[i] in found for i in rows)
+        return hits / exact.size
+
+
+class _StructView:
+    """Index struct whose ``embedding_dict`` only holds ANN candidates."""
+
+    def __init__(self, index_struct, embedding_dict):
+        self._index_struct = index_struct
+        self.embedding_dict = embedding_dict
+
+    def __getattr__(self, name):
+        return getattr(self._index_struct, name)
+
+
+class AnnKGTableRetriever(KGTableRetriever):
+    """``KGTableRetriever`` reading triplet embeddings from an ``IVFIndex``.
+
+    The embedding step of the parent retriever scores every triplet of the
+    index. Here it only sees the ``similarity_top_k`` candidates returned by
+    the ANN index, so its cost no longer grows with the graph.
+    """
+
+    def __init__(self, index, ann, **kwargs):
+        super().__init__(index, **kwargs)
+        self._ann = ann
+
+    def _retrieve(self, query_bundle):
+        query_embedding = self._embed_model.get_text_embedding(query_bundle.query_str)
+        candidates = self._ann.search(query_embedding, self.similarity_top_k)
+        # retrieve on a shallow copy, so concurrent queries don't share the view
+        retriever = copy.copy(self)
+        retriever._index_struct = _StructView(self._index_struct, candidates)
+        return KGTableRetriever._retrieve(retriever, query_bundle)
+
+
+def as_ann_query_engine(index, ann, llm=None, retriever_mode=None, **kwargs):
+    """Counterpart of ``index.as_query_engine`` using an ``IVFIndex``."""
+    retriever = AnnKGTableRetriever(
+        index,
+        ann,
+        object_map=index._object_map,
+        llm=index._llm,
+        embed_model=index._embed_model,
+        retriever_mode=retriever_mode or KGRetrieverMode.HYBRID,
+        **kwargs,
+    )
+    return RetrieverQueryEngine.from_args(retriever, llm=llm or Settings.llm, **kwargs)
@@ -0,0 +1,121 @@
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+
+def ask(engine, question):
+    """Queries a llama_index query engine or a langchain chain."""
+    if hasattr(engine, "query"):
+        return engine.query(question)
+    return engine.invoke(question)
+
+
+def _timed(call, engine, question):
+    # the engine call is timed inside ``call``, so rate limiter waits and
+    # retry backoffs are left out of the latency; only the last attempt,
+    # the one whose response is kept, is timed
+    attempts = []
+
+    def timed_ask(engine, question):
+        tic = time.perf_counter()
+        try:
+            return ask(engine, question)
+        finally:
+            attempts.append(time.perf_counter() - tic)
+
+    tic = time.perf_counter()
+    try:
+        response, error = call(timed_ask, engine, question), None
+    except Exception as e:
+        response, error = None, repr(e)
+    total = time.perf_counter() - tic
+    latency = attempts[-1] if attempts else np.nan
+    return {
+        "response": response,
+        "error": error,
+        "time": latency,
+        "retries": max(len(attempts) - 1, 0),
+        "wait": total - sum(attempts),
+    }
+
+
+def run_benchmark(engines, questions, concurrency=1, warmup=1, repeat=1, call=None):
+    """Runs every question against every engine and times each call.
+
+    Engines are benchmarked one after the other, each with up to
+    ``concurrency`` questions in flight, after ``warmup`` untimed questions
+    that fill caches and open connections. The warm-up questions are asked
+    again with the others, so they get answers, but run on warm caches and
+    are left out of the latency percentiles.
+
+    Latency is the duration of the engine call that produced the response.
+    Time spent waiting for the rate limiter or backing off, and the failed
+    attempts, are reported separately as ``wait`` and ``retries``.
+
+    Args:
+        engines: Mapping of ``(db, strategy)`` to a query engine or chain.
+        questions: Questions to ask.
+        concurrency: Number of concurrent calls per engine.
+        warmup: Number of leading questions asked once, untimed.
+        repeat: Number of times each question is asked.
+        call: Function of ``(fn, engine, question)`` making the call, e.g. a
+            rate limiter's ``call``.
+
+    Returns:
+        A list of result dicts (``db``, ``strategy``, ``question``,
+        ``response``, ``error``, ``time``, ``retries``, ``wait``, ``warm``)
+        and a summary DataFrame with the latency percentiles, throughput,
+        error rate, retries and mean limiter wait of each engine.
+    """
+    call = call or (lambda fn, *args: fn(*args))
+    warm = set(questions[:warmup])
+    results = []
+    summary = []
+
+    for (db, strategy), engine in engines.items():
+        for question in questions[:warmup]:
+            _timed(call, engine, question)
+
+        jobs = [q for q in questions for _ in range(repeat)]
+        tic = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            timed = list(pool.map(lambda q: _timed(call, engine, q), jobs))
+        wall = time.perf_counter() - tic
+
+        for question, result in zip(jobs, timed):
+            results.append(
+                {
+                    "db": db,
+                    "strategy": strategy,
+                    "question": question,
+                    **result,
+                    "warm": question in warm,
+                }
+            )
+
+        ok = [r for r in timed if r["error"] is None]
+        latencies = np.array(
+            [r["time"] for q, r in zip(jobs, timed) if r["error"] is None and q not in warm]
+        )
+        errors = len(jobs) - len(ok)
+        p50, p95, p99 = (
+            np.percentile(latencies, [50, 95, 99]) if len(latencies) else [np.nan] * 3
+        )
+        summary.append(
+            {
+                "db": db,
+                "strategy": strategy,
+                "calls": len(jobs),
+                "timed": len(latencies),
+                "error_rate": errors / max(len(jobs), 1),
+                "p50": p50,
+                "p95": p95,
+                "p99": p99,
+                "throughput": len(ok) / wall if wall > 0 else np.nan,
+                "retries": sum(r["retries"] for r in timed),
+                "wait": np.mean([r["wait"] for r in timed]) if timed else np.nan,
+            }
+        )
+
+    return results, pd.DataFrame(summary)
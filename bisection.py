@@ -0,0 +1,141 @@
+import json
+import threading
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from functools import lru_cache
+from utils import hash_string, read_rows
+from llama_index.core.schema import Document
+
+
+class FileText:
+    """Lowercased, space-joined text of a file's rows, with row offsets.
+
+    Args:
+        first: Label of the first row.
+        texts: Text of the rows, in order.
+    """
+
+    def __init__(self, first, texts):
+        lowered = [t.lower() for t in texts]
+        self.first = first
+        self.text = " ".join(lowered)
+        # offsets[i] is where row i starts, rows being followed by a space
+        lengths = np.fromiter((len(t) + 1 for t in lowered), dtype=np.int64)
+        self.offsets = np.concatenate(([0], np.cumsum(lengths)))
+
+    def span(self, start, end):
+        """Returns the text of rows ``[start, end)``, given as row labels."""
+        n = len(self.offsets) - 1
+        i = min(max(start - self.first, 0), n)
+        j = min(max(end - self.first, 0), n)
+        if j <= i:
+            return ""
+        return self.text[self.offsets[i] : self.offsets[j] - 1]
+
+
+class Bisector:
+    """Bisects chunks whose prompt was blocked or stopped by the LLM.
+
+    The text of a file is loaded once, on its first bisection, into a
+    ``FileText``, and halves are sliced from it at every recursion level.
+    Spans that are still blocked at ``max_depth``, or that can't be split
+    further, are appended to ``rejected_path`` and skipped from then on,
+    including in later runs.
+
+    Args:
+        corpus_path: Path to the corpus CSV.
+        rejected_path: JSONL file of rejected spans.
+        block_size: ``block_size`` metadata of the halves.
+        max_depth: Maximum number of nested bisections.
+        cache_size: Number of files kept in memory.
+        store: Optional ``CorpusStore`` of the corpus, read instead of the CSV.
+    """
+
+    def __init__(
+        self, corpus_path, rejected_path, block_size, max_depth=6, cache_size=8, store=None
+    ):
+        self.corpus_path = corpus_path
+        self.store = store
+        self.rejected_path = Path(rejected_path)
+        self.block_size = block_size
+        self.max_depth = max_depth
+        self.lock = threading.Lock()
+        self.extents = None
+        self.file_text = lru_cache(maxsize=cache_size)(self._load_file_text)
+
+        self.rejected = set()
+        if self.rejected_path.exists():
+            with open(self.rejected_path, encoding="utf-8") as fd:
+                self.rejected = {json.loads(line)["hash"] for line in fd if line.strip()}
+
+    def _file_extents(self):
+        # first and last row label of every file, read once and lazily
+        with self.lock:
+            if self.extents is None and self.store is not None:
+                extents = {}
+                for fname, start, end in self.store.files():
+                    first, last = extents.get(fname, (start, end - 1))
+                    extents[fname] = (min(first, start), max(last, end - 1))
+                self.extents = extents
+            elif self.extents is None:
+                extents = {}
+                batches = pd.read_csv(self.corpus_path, usecols=["fname"], chunksize=100_000)
+                for batch in batches:
+                    for fname, rows in batch.groupby("fname").groups.items():
+                        first, last = extents.get(fname, (rows.min(), rows.max()))
+                        extents[fname] = (min(first, rows.min()), max(last, rows.max()))
+                self.extents = extents
+        return self.extents
+
+    def _load_file_text(self, source):
+        first, last = self._file_extents()[source]
+        if self.store is not None:
+            return FileText(first, self.store.rows(first, last + 1))
+        return FileText(first, read_rows(self.corpus_path, first, last + 1))
+
+    def is_rejected(self, text):
+        return hash_string(text) in self.rejected
+
+    def reject(self, node):
+        """Records a node's span as rejected."""
+        digest = hash_string(node.text)
+        record = {key: node.metadata.get(key) for key in ("source", "start", "end")}
+        with self.lock:
+            if digest in self.rejected:
+                return
+            self.rejected.add(digest)
+            with open(self.rejected_path, "a", encoding="utf-8") as fd:
+                fd.write(json.dumps({"hash": digest, **record}) + "\n")
+
+    def split(self, node):
+        """Splits a node's row span in two halves.
+
+        Returns:
+            The non-empty halves, as Documents.
+        """
+        start = node.metadata.get("start")
+        end = node.metadata.get("end")
+
+        mid = start + (end - start) // 2
+        file_text = self.file_text(node.metadata["source"])
+        halves = [
+            (file_text.span(start, mid).strip(), start, mid),
+            (file_text.span(mid, end).strip(), mid + 1, end),
+        ]
+
+        nodes = []
+        for text, span_start, span_end in halves:
+            if len(text) == 0:
+                continue
+            metadata = node.metadata.copy()
+            metadata.update(
+                {
+                    "block_size": self.block_size,
+                    "size": len(text) + 1,
+                    "start": span_start,
+                    "end": span_end,
+                }
+            )
+            nodes.append(Document(text=text, metadata=metadata))
+        return nodes
@@ -0,0 +1,103 @@
+import os
+import json
+from pathlib import Path
+
+
+def chunk_id(metadata):
+    """Returns the id of a chunk, as written in the triplet files."""
+    return f'{metadata["source"]}__{metadata["start"]}__{metadata["end"]}'
+
+
+class JsonlWriter:
+    """Append-only JSONL writer keeping a single buffered handle open."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.fd = open(self.path, "a", encoding="utf-8")
+
+    def write(self, record):
+        self.fd.write(json.dumps(record) + "\n")
+
+    def sync(self):
+        """Flushes buffered records and forces them to disk."""
+        self.fd.flush()
+        os.fsync(self.fd.fileno())
+
+    def close(self):
+        self.fd.close()
+
+
+class Checkpoint:
+    """Crash-safe progress of an extraction run.
+
+    Records are appended to one JSONL file per name. Chunks are marked as
+    done as they are processed, and become durable on ``commit``, which
+    syncs the record files and then appends the chunk ids to the progress
+    file. On resume, records of chunks that were not committed are dropped,
+    so they are written again, once, when their chunks are reprocessed.
+
+    Args:
+        path: Progress file, one committed chunk id per line.
+        files: Mapping of record names to JSONL paths.
+        every: Number of marked chunks after which a commit is due.
+        resume: Whether to keep the progress of a previous run. When False
+            the progress and record files are cleared.
+    """
+
+    def __init__(self, path, files, every=50, resume=True):
+        self.path = Path(path)
+        self.every = every
+        self.pending = []
+        self.done = set()
+        if resume and self.path.exists():
+            self.done = set(self.path.read_text(encoding="utf-8").split())
+
+        for file in files.values():
+            self._drop_uncommitted(Path(file))
+        self.writers = {name: JsonlWriter(file) for name, file in files.items()}
+        self.progress = open(self.path, "w" if not self.done else "a", encoding="utf-8")
+
+    def _drop_uncommitted(self, path):
+        if not path.exists():
+            return
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with open(path, encoding="utf-8") as src, open(tmp, "w", encoding="utf-8") as dst:
+            for line in src:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # torn last line of a crashed run
+                    continue
+                if record.get("id") in self.done:
+                    dst.write(line)
+        os.replace(tmp, path)
+
+    def write(self, name, record):
+        """Appends a record, which must carry its chunk ``id``."""
+        self.writers[name].write(record)
+
+    def mark(self, chunk):
+        """Marks a chunk id as processed.
+
+        Returns:
+            True when enough chunks are pending for a commit to be due.
+        """
+        self.pending.append(chunk)
+        return len(self.pending) >= self.every
+
+    def commit(self):
+        """Makes the records and chunks marked so far durable."""
+        for writer in self.writers.values():
+            writer.sync()
+        for chunk in self.pending:
+            self.progress.write(chunk + "\n")
+        self.progress.flush()
+        os.fsync(self.progress.fileno())
+        self.done.update(self.pending)
+        self.pending = []
+
+    def close(self):
+        self.commit()
+        for writer in self.writers.values():
+            writer.close()
+        self.progress.close()
@@ -0,0 +1,279 @@
+"""Command-line entry point of the pipeline.
+
+    python cli.py chunk --chunk-size 4096 --overlap 50
+    python cli.py build --db-id mydb --exp-tag experiment1 --chunk-size 4096 --overlap 50 --max-triplets 10
+    python cli.py evaluate --db-id mydb --exp-tag experiment1 --chunk-size 4096 --overlap 50 --max-triplets 10
+    python cli.py sweep --db-id mydb --chunk-size 2048 4096 --overlap 0 50 --max-triplets 5 10 --url bolt://db1:7687 bolt://db2:7687
+    python cli.py serve
+
+Each subcommand imports only the modules it needs: ``chunk`` never loads an
+LLM client and ``evaluate`` loads the persisted index without the
+extraction stack. The Neo4j password is read from ``NEO4J_PASSWORD``.
+"""
+
+import os
+import re
+import sys
+import json
+import argparse
+from pathlib import Path
+
+import RAGout
+
+
+def add_experiment_arguments(parser):
+    parser.add_argument("--db-id", required=True, help="Database ID")
+    parser.add_argument("--exp-tag", default="experiment", help="Experiment tag")
+    parser.add_argument("--chunk-size", type=int, required=True, help="Chunk size")
+    parser.add_argument("--overlap", type=int, required=True, help="Overlap value")
+    parser.add_argument(
+        "--max-triplets", type=int, required=True, help="Maximum number of triplets"
+    )
+    parser.add_argument(
+        "--url",
+        default=os.environ.get("NEO4J_URL", "bolt://localhost:7687"),
+        help="URL of the Neo4j database",
+    )
+
+
+def neo4j_password():
+    password = os.environ.get("NEO4J_PASSWORD")
+    if not password:
+        raise EnvironmentError("NEO4J_PASSWORD environment variable is required.")
+    return password
+
+
+def experiment(args):
+    return RAGout.Experiment(
+        neo4j_password(),
+        args.url,
+        args.db_id,
+        args.overlap,
+        args.exp_tag,
+        args.chunk_size,
+        args.max_triplets,
+    )
+
+
+def chunk(args):
+    from corpus_store import open_corpus
+
+    output = args.output or f"chunks_{args.chunk_size}_{args.overlap}.jsonl"
+    corpus = open_corpus(args.corpus, args.store)
+    count = 0
+    with open(output, "w", encoding="utf-8") as fd:
+        for doc in corpus.overlap_documents(args.chunk_size, args.overlap):
+            fd.write(json.dumps({"text": doc.text, "metadata": doc.metadata}) + "\n")
+            count += 1
+    print(f"chunks: {count}, output: {output}")
+
+
+def build(args):
+    RAGout.build(
+        experiment(args), args.MAX_IN_FLIGHT, args.RESTART, args.START, args.STOP
+    )
+
+
+def evaluate(args):
+    RAGout.evaluate(
+        experiment(args),
+        concurrency=args.CONCURRENCY,
+        warmup=args.WARMUP,
+        max_in_flight=args.MAX_IN_FLIGHT,
+    )
+
+
+# arguments of the sweep, set in every worker by init_sweep_worker
+SWEEP_ARGS = None
+
+
+def init_sweep_worker(args, processes):
+    global SWEEP_ARGS
+    SWEEP_ARGS = args
+    # the workers share the Gemini quota
+    from rate_limit import gemini_limiter
+
+    gemini_limiter().scale(1 / processes)
+
+
+def sweep_label(exp_tag, config):
+    """Node label of a sweep configuration, so configurations sharing a
+    database don't share entities."""
+    name = f"Entity_{exp_tag}_{config['chunk_size']}_{config['max_triplets']}"
+    return re.sub(r"\W", "_", name)
+
+
+def assign_urls(configs, urls, cost):
+    """Spreads the configurations of a sweep over databases.
+
+    With a database per configuration, each gets its own. Otherwise the
+    ``(chunk size, overlap)`` pairs are assigned, the most costly first, to
+    the database with the least work so far, so configurations sharing a
+    pair run one after the other and reuse its cached triplets. Each
+    configuration gets the ``url`` of its database.
+    """
+    if len(urls) >= len(configs):
+        return [{**c, "url": url} for c, url in zip(configs, urls)]
+
+    pairs = {}
+    for config in configs:
+        key = (config["chunk_size"], config["overlap"])
+        pairs[key] = pairs.get(key, 0) + cost(config)
+    load = dict.fromkeys(urls, 0)
+    assigned = {}
+    for key in sorted(pairs, key=lambda k: -pairs[k]):
+        url = min(load, key=load.get)
+        assigned[key] = url
+        load[url] += pairs[key]
+    return [{**c, "url": assigned[c["chunk_size"], c["overlap"]]} for c in configs]
+
+
+def run_sweep_config(config):
+    """Builds and evaluates the experiment of a sweep configuration.
+
+    Returns:
+        The number of successful calls made through each rate limiter.
+    """
+    from rate_limit import LIMITERS
+
+    args = SWEEP_ARGS
+    before = {
+        name: limiter.report().get("success", 0) for name, limiter in LIMITERS.items()
+    }
+    # the overlap is not part of the experiment's file names, so it goes in
+    # the tag to keep configurations apart
+    exp_tag = f"{args.exp_tag}_overlap_{config['overlap']}"
+    exp = RAGout.Experiment(
+        neo4j_password(),
+        config["url"],
+        args.db_id,
+        config["overlap"],
+        exp_tag,
+        config["chunk_size"],
+        config["max_triplets"],
+        node_label=sweep_label(exp_tag, config),
+    )
+    kg_index = RAGout.build(exp, args.MAX_IN_FLIGHT, args.RESTART, args.START, args.STOP)
+    RAGout.evaluate(exp, kg_index, args.CONCURRENCY, args.WARMUP, args.MAX_IN_FLIGHT)
+    return {
+        f"{name}_calls": limiter.report().get("success", 0) - before.get(name, 0)
+        for name, limiter in LIMITERS.items()
+    }
+
+
+def sweep(args):
+    from sweep import grid, run_sweep
+    from corpus_store import open_corpus
+
+    # larger triplet limits first: the triplet cache serves smaller limits
+    # from them
+    configs = grid(
+        chunk_size=args.chunk_size,
+        overlap=args.overlap,
+        max_triplets=sorted(set(args.max_triplets), reverse=True),
+    )
+
+    # the corpus store and the chunk spans of every (chunk size, overlap)
+    # pair are built once, here, and memory-mapped by the workers
+    corpus = open_corpus(RAGout.CORPUS_FILE)
+    chunks = {}
+    for config in configs:
+        key = (config["chunk_size"], config["overlap"])
+        if key not in chunks:
+            chunks[key] = len(corpus.overlap_spans(*key)[args.START : args.STOP])
+    corpus.close()
+
+    def cost(config):
+        return chunks[config["chunk_size"], config["overlap"]]
+
+    # configurations writing to the same database run one after the other,
+    # so none is benchmarked while another loads the database
+    urls = list(dict.fromkeys(args.url))
+    configs = assign_urls(configs, urls, cost)
+    processes = args.processes or len({config["url"] for config in configs})
+    run_sweep(
+        run_sweep_config,
+        configs,
+        processes=processes,
+        initializer=init_sweep_worker,
+        initargs=(args, processes),
+        chain=lambda config: config["url"],
+        cost=cost,
+        report=args.report or f"sweep_{args.db_id}_{args.exp_tag}.csv",
+    )
+
+
+def serve(args):
+    import subprocess
+
+    server = Path(__file__).resolve().parent / "server"
+    command = [sys.executable, "-m", "streamlit", "run", "app.py"]
+    if args.port:
+        command += ["--server.port", str(args.port)]
+    return subprocess.call(command, cwd=server)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Doctor RAG pipeline.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    parser_chunk = commands.add_parser("chunk", help="Chunk the corpus with overlap")
+    parser_chunk.add_argument("--chunk-size", type=int, required=True)
+    parser_chunk.add_argument("--overlap", type=int, required=True)
+    parser_chunk.add_argument("--corpus", default=RAGout.CORPUS_FILE)
+    parser_chunk.add_argument(
+        "--store", help="Corpus store directory, {CORPUS}_store next to the CSV by default"
+    )
+    parser_chunk.add_argument(
+        "--output", help="JSONL output, chunks_{CHUNK_SIZE}_{OVERLAP}.jsonl by default"
+    )
+    parser_chunk.set_defaults(run=chunk)
+
+    parser_build = commands.add_parser("build", help="Extract triplets and build the KG")
+    add_experiment_arguments(parser_build)
+    RAGout.add_run_arguments(parser_build, evaluate=False)
+    parser_build.set_defaults(run=build)
+
+    parser_evaluate = commands.add_parser(
+        "evaluate", help="Evaluate the query strategies on a built KG"
+    )
+    add_experiment_arguments(parser_evaluate)
+    RAGout.add_run_arguments(parser_evaluate, build=False)
+    parser_evaluate.set_defaults(run=evaluate)
+
+    parser_sweep = commands.add_parser(
+        "sweep", help="Build and evaluate every configuration of a parameter grid"
+    )
+    parser_sweep.add_argument("--db-id", required=True, help="Database ID")
+    parser_sweep.add_argument("--exp-tag", default="experiment", help="Experiment tag")
+    parser_sweep.add_argument("--chunk-size", type=int, nargs="+", required=True)
+    parser_sweep.add_argument("--overlap", type=int, nargs="+", required=True)
+    parser_sweep.add_argument("--max-triplets", type=int, nargs="+", required=True)
+    parser_sweep.add_argument(
+        "--url",
+        nargs="+",
+        default=[os.environ.get("NEO4J_URL", "bolt://localhost:7687")],
+        help="URLs of the Neo4j databases the configurations are spread over",
+    )
+    parser_sweep.add_argument(
+        "--processes",
+        type=int,
+        help="Worker processes, one per database by default",
+    )
+    parser_sweep.add_argument(
+        "--report", help="Per-configuration CSV, sweep_{DB_ID}_{EXP_TAG}.csv by default"
+    )
+    RAGout.add_run_arguments(parser_sweep)
+    # the whole corpus, unlike a single build
+    parser_sweep.set_defaults(run=sweep, START=None, STOP=None)
+
+    parser_serve = commands.add_parser("serve", help="Run the Streamlit chat interface")
+    parser_serve.add_argument("--port", type=int)
+    parser_serve.set_defaults(run=serve)
+
+    args = parser.parse_args(argv)
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,18 +4,25 @@
 # 10.2. Clinical Relation Extraction Model Visualization with Neo4j
 
 
+import os
 import re
 import time
+import shutil
+import argparse
+import threading
+import multiprocessing
 import pandas as pd
 from tqdm import tqdm
 from pathlib import Path
 from itertools import product
-from utils import Neo4jConnection, get_relations_df, get_triples
+from collections import Counter
+from utils import Neo4jConnection, get_relations_df, get_triples, hash_string
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import DirectoryLoader, PyPDFDirectoryLoader
 from pyspark.sql.types import StructType, StructField, StringType, IntegerType
 from summary import *
 from sparknlp.base import LightPipeline
+from sweep import run_sweep
 
 
 # uri = "bolt://localhost:7687"
@@ -23,71 +30,177 @@ from sparknlp.base import LightPipeline
 # user = "neo4j"
 # conn = Neo4jConnection(uri=uri, user=user, pwd=pwd)
 
-def infer(pipeline, data):
-    empty_data = spark.createDataFrame([[""]]).toDF("text")
-    model = pipeline.fit(empty_data)
-    lmodel = LightPipeline(model)
-    annotations = lmodel.fullAnnotate(data)
-    res_df = get_relations_df(annotations)
-    return res_df
+class InferenceEngine:
+    """Fitted Spark NLP pipelines, reused by every chunk of the process.
+
+    Each pipeline is fitted once, on first use, and chunks are annotated in
+    batches: with ``LightPipeline.fullAnnotate`` on the driver, or, when
+    ``distributed``, as a DataFrame transform split in partitions over the
+    local cores.
+
+    Args:
+        spark: The Spark session.
+        pipelines: Unfitted pipelines, by name.
+        batch_size: Number of texts per ``fullAnnotate`` call.
+        distributed: Whether to annotate with a DataFrame transform.
+        partitions: Number of partitions of the transform, the default
+            parallelism of the session (one per core) if not given.
+    """
+
+    def __init__(self, spark, pipelines, batch_size=32, distributed=False, partitions=None):
+        self.spark = spark
+        self.pipelines = pipelines
+        self.batch_size = batch_size
+        self.distributed = distributed
+        self.partitions = partitions
+        self.models = {}
+        self.lock = threading.Lock()
+
+    def model(self, name):
+        """Returns the fitted model and LightPipeline of a pipeline."""
+        with self.lock:
+            if name not in self.models:
+                empty_data = self.spark.createDataFrame([[""]]).toDF("text")
+                model = self.pipelines[name].fit(empty_data)
+                self.models[name] = (model, LightPipeline(model))
+            return self.models[name]
+
+    def annotate(self, name, texts):
+        """Extracts the relations of texts with a pipeline.
+
+        Returns:
+            A relations DataFrame per text, in the order of ``texts``.
+        """
+        model, lmodel = self.model(name)
+        if self.distributed:
+            return self._transform(model, texts)
+
+        results = []
+        for start in range(0, len(texts), self.batch_size):
+            annotations = lmodel.fullAnnotate(texts[start : start + self.batch_size])
+            results.extend(get_relations_df([a]) for a in annotations)
+        return results
+
+    def _transform(self, model, texts):
+        partitions = self.partitions or self.spark.sparkContext.defaultParallelism
+        df = self.spark.createDataFrame(list(enumerate(texts)), ["id", "text"])
+        rows = model.transform(df.repartition(partitions)).select("id", "relations").collect()
+        relations = {row["id"]: row["relations"] for row in rows}
+        return [get_relations_df([{"relations": relations[i]}]) for i in range(len(texts))]
 
-loader = PyPDFDirectoryLoader("busca__final")
-docs = loader.load()
 
 CHUNK_SIZE = [512, 1024, 2048, 4096]
 CHUNK_OVERLAP = [0, 24, 56]
 
-catalog_df = pd.read_csv("catalog.csv")
+PIPELINES = {
+    "clinical_temp_events_re_pipeline": clinical_temp_events_re_pipeline,
+    "clinical_re_pipeline": clinical_re_pipeline,
+    "posology_relation_extraction_pipeline": posology_relation_extraction_pipeline,
+}
 
-for chunk_size, chunk_overlap in product(CHUNK_SIZE, CHUNK_OVERLAP):
-    # print("M: ", chunk_size, chunk_overlap)
+# relations of every annotated text, by pipeline and text hash, shared by
+# all configurations
+CACHE_DIR = Path("cleaned_data__cache")
 
-    output_dir = Path(f"cleaned_data__{chunk_size}_{chunk_overlap}")
-    output_dir.mkdir(parents=True, exist_ok=True)
+# chunks of every configuration and the inference engine of the process,
+# set in every worker by init_worker
+CHUNKS = None
+ENGINE = None
 
-    clinical_temp_dir = output_dir / "clinical_temp_events_re_pipeline"
-    clinical_temp_dir.mkdir(parents=True, exist_ok=True)
-
-    clinical_re_dir = output_dir / "clinical_re_pipeline"
-    clinical_re_dir.mkdir(parents=True, exist_ok=True)
-
-    posology_dir = output_dir / "posology_relation_extraction_pipeline"
-    posology_dir.mkdir(parents=True, exist_ok=True)
 
+def split(docs, chunk_size, chunk_overlap):
+    """Chunks of a configuration; a chunk size of 0 keeps the pages whole."""
+    if chunk_size == 0:
+        return docs
     text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-    chunks = text_splitter.split_documents(docs)
-
-    offset = 0
-    chunks = chunks[offset:]
-
-
-    for i, chunk in tqdm(enumerate(chunks, offset), total=len(chunks)):
-        
-        text = chunk.page_content
-        file_path = chunk.metadata.get("source")
-        file_name = Path(file_path).stem
-
-        # value_of_B = catalog_df.loc[catalog_df['md5sum'] == hash, 'B'].values[0]
-        doc_text = chunk.page_content.replace('-\n', '')
-        # doc_text = re.sub(r'(?<!\.)\n', ' ', doc_text)
-
-        if not Path(clinical_temp_dir / f"{i}_{file_name}.csv").exists():
-            events_df = infer(clinical_temp_events_re_pipeline, text)
-            events_df.to_csv(clinical_temp_dir / f"{i}_{file_name}.csv", index=None)
-
-        if not Path(clinical_re_dir / f"{i}_{file_name}.csv").exists():
-            clinical_re_df = infer(clinical_re_pipeline, text)
-            clinical_re_df.confidence = clinical_re_df.confidence.astype(float)
-            # clinical_re_df = clinical_re_df[clinical_re_df.relation != "O"]
-            # print("clinical_re_pipeline: ", clinical_re_df)
-            clinical_re_df.to_csv(clinical_re_dir / f"{i}_{file_name}.csv", index=None)
-
-        if not Path(posology_dir / f"{i}_{file_name}.csv").exists():
-            posology_df = infer(posology_relation_extraction_pipeline, text)
-            # print("posology_relation_extraction_pipeline: ", posology_df)
-            posology_df.to_csv(posology_dir / f"{i}_{file_name}.csv", index=None)
-
-        # graph_df = infer(graph_extraction_pipeline, text)
+    return text_splitter.split_documents(docs)
+
+
+def output_dir(chunk_size, chunk_overlap):
+    if chunk_size == 0:
+        return Path("cleaned_data__plain")
+    return Path(f"cleaned_data__{chunk_size}_{chunk_overlap}")
+
+
+def extract(name, texts, paths):
+    """Writes the relations found in texts by a pipeline, one file per text.
+
+    Texts whose file already exists are skipped and texts annotated before,
+    for this or another configuration, are read from the cache; the others
+    are annotated together.
+
+    Returns:
+        The number of texts that were ``"done"``, ``"cached"`` and
+        ``"annotated"``.
+    """
+    stats = Counter()
+    pending, todo = [], {}
+    for text, path in zip(texts, paths):
+        if path.exists():
+            stats["done"] += 1
+            continue
+        cached = CACHE_DIR / name / f"{hash_string(text)}.csv"
+        if cached.exists() or cached in todo:
+            stats["cached"] += 1
+        else:
+            stats["annotated"] += 1
+            todo[cached] = text
+        pending.append((cached, path))
+
+    if todo:
+        (CACHE_DIR / name).mkdir(parents=True, exist_ok=True)
+        relations = ENGINE.annotate(name, list(todo.values()))
+        for cached, df in zip(todo, relations):
+            if name == "clinical_re_pipeline":
+                df.confidence = df.confidence.astype(float)
+                # df = df[df.relation != "O"]
+            # written aside and renamed, as other workers may read it meanwhile
+            partial = cached.with_suffix(f".{os.getpid()}.partial")
+            df.to_csv(partial, index=None)
+            os.replace(partial, cached)
+
+    for cached, path in pending:
+        shutil.copyfile(cached, path)
+    return stats
+
+
+def init_worker(chunks, batch_size, distributed):
+    global CHUNKS, ENGINE
+    CHUNKS = chunks
+    ENGINE = InferenceEngine(spark, PIPELINES, batch_size, distributed)
+
+
+def run_config(config):
+    """Extracts the relations of every chunk of a configuration."""
+    chunk_size, chunk_overlap = config["chunk_size"], config["chunk_overlap"]
+    chunks = CHUNKS[chunk_size, chunk_overlap]
+
+    dirs = {}
+    for name in PIPELINES:
+        dirs[name] = output_dir(chunk_size, chunk_overlap) / name
+        dirs[name].mkdir(parents=True, exist_ok=True)
+
+    stats = Counter(chunks=len(chunks), done=0, cached=0, annotated=0)
+    batch_size = ENGINE.batch_size
+    for start in tqdm(range(0, len(chunks), batch_size), leave=False):
+        texts, names = [], []
+        for i, chunk in enumerate(chunks[start : start + batch_size], start):
+
+            text = chunk.page_content
+            file_path = chunk.metadata.get("source")
+            file_name = Path(file_path).stem
+
+            # value_of_B = catalog_df.loc[catalog_df['md5sum'] == hash, 'B'].values[0]
+            doc_text = chunk.page_content.replace('-\n', '')
+            # doc_text = re.sub(r'(?<!\.)\n', ' ', doc_text)
+
+            texts.append(text)
+            names.append(f"{i}_{file_name}.csv")
+
+        for name in PIPELINES:
+            stats.update(extract(name, texts, [dirs[name] / n for n in names]))
+
+        # graph_df = ENGINE.annotate("graph_extraction_pipeline", [text])[0]
 
         # # df = spark.createDataFrame(
         # df = pd.DataFrame({"id": [0], "text" : [doc_text] })
@@ -104,29 +217,60 @@ for chunk_size, chunk_overlap in product(CHUNK_SIZE, CHUNK_OVERLAP):
 
         # # add_ners_rels(rel_df)
 
-output_dir = Path(f"cleaned_data__plain")
-output_dir.mkdir(parents=True, exist_ok=True)
-
-
-for i, chunk in tqdm(enumerate(docs, offset), total=len(chunks)):
-    
-    text = chunk.page_content
-    file_path = chunk.metadata.get("source")
-    file_name = Path(file_path).stem
-
-    # value_of_B = catalog_df.loc[catalog_df['md5sum'] == hash, 'B'].values[0]
-    doc_text = chunk.page_content.replace('-\n', '')
-    # doc_text = re.sub(r'(?<!\.)\n', ' ', doc_text)
-
-    events_df = infer(clinical_temp_events_re_pipeline, text)
-    events_df.to_csv(clinical_temp_dir / f"{i}_{file_name}.csv", index=None)
-
-    clinical_re_df = infer(clinical_re_pipeline, text)
-    clinical_re_df.confidence = clinical_re_df.confidence.astype(float)
-    # clinical_re_df = clinical_re_df[clinical_re_df.relation != "O"]
-    # print("clinical_re_pipeline: ", clinical_re_df)
-    clinical_re_df.to_csv(clinical_re_dir / f"{i}_{file_name}.csv", index=None)
-
-    posology_df = infer(posology_relation_extraction_pipeline, text)
-    # print("posology_relation_extraction_pipeline: ", posology_df)
-    posology_df.to_csv(posology_dir / f"{i}_{file_name}.csv", index=None)
+    return dict(stats)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract clinical relations for a chunking grid.")
+    parser.add_argument("--input-dir", default="busca__final", help="Directory of the PDFs")
+    parser.add_argument("--chunk-size", type=int, nargs="+", default=CHUNK_SIZE)
+    parser.add_argument("--overlap", type=int, nargs="+", default=CHUNK_OVERLAP)
+    parser.add_argument("--no-plain", action="store_true", help="Skip the whole page run")
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="Worker processes, each running its own Spark session",
+    )
+    parser.add_argument("--report", default="sweep_clinical.csv", help="Per-configuration CSV")
+    parser.add_argument(
+        "--batch-size", type=int, default=32, help="Chunks annotated per pipeline call"
+    )
+    parser.add_argument(
+        "--distributed",
+        action="store_true",
+        help="Annotate with a Spark DataFrame transform over all local cores",
+    )
+    args = parser.parse_args()
+
+    loader = PyPDFDirectoryLoader(args.input_dir)
+    docs = loader.load()
+
+    catalog_df = pd.read_csv("catalog.csv")
+
+    configs = [
+        {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+        for chunk_size, chunk_overlap in product(args.chunk_size, args.overlap)
+    ]
+    if not args.no_plain:
+        configs.append({"chunk_size": 0, "chunk_overlap": 0})
+
+    # the PDFs are loaded and split once, here, for every configuration
+    chunks = {}
+    for config in configs:
+        key = config["chunk_size"], config["chunk_overlap"]
+        chunks[key] = split(docs, *key)
+
+    t1 = time.time()
+    run_sweep(
+        run_config,
+        configs,
+        processes=args.processes,
+        initializer=init_worker,
+        initargs=(chunks, args.batch_size, args.distributed),
+        cost=lambda config: len(chunks[config["chunk_size"], config["chunk_overlap"]]),
+        report=args.report,
+        # a forked worker would share the parent's Spark gateway
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+    print("elapsed: ", time.time() - t1)
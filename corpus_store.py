@@ -0,0 +1,209 @@
+import os
+import json
+import mmap
+import shutil
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from utils import hash_string, overlap_spans
+from llama_index.core.schema import Document
+
+
+class CorpusStore:
+    """Compact, memory-mapped copy of ``corpus.csv``.
+
+    Rows are stored once, UTF-8 encoded and joined by ``"\\n"`` in
+    ``text.bin``, with NumPy arrays of row byte offsets, file ids and
+    lowercased row lengths, and a table of file names. Rows of a file are
+    contiguous, so the text of an overlap chunk is a single slice of the
+    buffer. Row numbers are the row labels of ``pd.read_csv(corpus.csv)``.
+
+    Chunk sets are persisted in the store directory per (chunk_size,
+    overlap), so parameter sweeps only compute the spans once. The store and
+    its chunk sets are written aside and moved into place once complete, so
+    an interrupted build or save never leaves a partial one behind.
+
+    Args:
+        path: Store directory, written by ``build``.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.names = json.loads((self.path / "names.json").read_text(encoding="utf-8"))
+        self.offsets = np.load(self.path / "offsets.npy", mmap_mode="r")
+        self.file_ids = np.load(self.path / "file_ids.npy", mmap_mode="r")
+        self.lengths = np.load(self.path / "lengths.npy", mmap_mode="r")
+
+        self.fd = open(self.path / "text.bin", "rb")
+        size = self.path.joinpath("text.bin").stat().st_size
+        # an empty file cannot be mapped
+        self.buffer = mmap.mmap(self.fd.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+        # file i spans rows [file_starts[i], file_starts[i + 1])
+        n = len(self.file_ids)
+        changes = np.flatnonzero(np.diff(self.file_ids)) + 1 if n else np.array([], int)
+        self.file_starts = np.concatenate(([0], changes, [n])).astype(np.int64)
+
+    @classmethod
+    def build(cls, csv_path, path, batch_size=100_000):
+        """Converts a corpus CSV (``fname`` and ``text`` columns) to a store.
+
+        Args:
+            csv_path: Path to the corpus CSV.
+            path: Store directory.
+            batch_size: Number of rows read per batch.
+
+        Returns:
+            The opened store.
+        """
+        # written aside, then moved into place
+        final = Path(path)
+        path = final.with_name(f"{final.name}.{os.getpid()}.partial")
+        shutil.rmtree(path, ignore_errors=True)
+        path.mkdir(parents=True)
+
+        names, ids = [], {}
+        offsets, file_ids, lengths = [np.zeros(1, np.int64)], [], []
+        position = 0
+        with open(path / "text.bin", "wb") as fd:
+            for batch in pd.read_csv(csv_path, chunksize=batch_size):
+                texts = batch["text"].fillna("")
+                encoded = [t.encode("utf-8") for t in texts]
+                # every row is followed by a separator, so row i ends one byte
+                # before offsets[i + 1]
+                sizes = np.fromiter((len(e) + 1 for e in encoded), np.int64, len(encoded))
+                fd.write(b"\n".join(encoded) + b"\n" if encoded else b"")
+                offsets.append(position + np.cumsum(sizes))
+                position += int(sizes.sum())
+
+                for name in batch["fname"].unique():
+                    if name not in ids:
+                        ids[name] = len(names)
+                        names.append(name)
+                file_ids.append(batch["fname"].map(ids).to_numpy(np.int32))
+                lengths.append(texts.str.lower().str.len().to_numpy(np.int64))
+
+        np.save(path / "offsets.npy", np.concatenate(offsets))
+        np.save(path / "file_ids.npy", np.concatenate(file_ids or [np.zeros(0, np.int32)]))
+        np.save(path / "lengths.npy", np.concatenate(lengths or [np.zeros(0, np.int64)]))
+        (path / "names.json").write_text(json.dumps(names), encoding="utf-8")
+
+        # the previous store, with its chunk sets, is replaced as a whole;
+        # readers that have it open keep their files until they close them
+        old = final.with_name(f"{final.name}.{os.getpid()}.old")
+        if final.exists():
+            os.replace(final, old)
+        os.replace(path, final)
+        shutil.rmtree(old, ignore_errors=True)
+        return cls(final)
+
+    def __len__(self):
+        return len(self.file_ids)
+
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+        self.fd.close()
+
+    def text(self, start, end):
+        """Text of rows ``[start, end)``, joined by ``"\\n"``."""
+        if end <= start:
+            return ""
+        lo, hi = int(self.offsets[start]), int(self.offsets[end]) - 1
+        return str(memoryview(self.buffer)[lo:hi], "utf-8")
+
+    def rows(self, start, end):
+        """Texts of rows ``[start, end)``."""
+        # rows may contain newlines, so they are sliced rather than split
+        view = memoryview(self.buffer)
+        bounds = self.offsets[start : end + 1].tolist()
+        return [str(view[lo : hi - 1], "utf-8") for lo, hi in zip(bounds, bounds[1:])]
+
+    def files(self):
+        """Yields ``(name, start, end)`` row ranges, in corpus order."""
+        for i in range(len(self.file_starts) - 1):
+            start, end = int(self.file_starts[i]), int(self.file_starts[i + 1])
+            yield self.names[int(self.file_ids[start])], start, end
+
+    def overlap_spans(self, chunk_size, overlap):
+        """Deduplicated overlap chunk spans, persisted per parameter set.
+
+        Returns:
+            An int64 array of ``(file_id, start, end, size)`` rows, ``start``
+            and ``end`` being inclusive row numbers.
+        """
+        cache = self.path / f"chunks_{chunk_size}_{overlap}.npy"
+        if cache.exists():
+            return np.load(cache)
+
+        spans = []
+        hashes = set()
+        for name, lo, hi in self.files():
+            labels = np.arange(lo, hi)
+            for start, end, size in overlap_spans(
+                labels, self.lengths[lo:hi], chunk_size, overlap
+            ):
+                hashed_value = hash_string(self.text(start, end + 1))
+                if hashed_value in hashes:
+                    print("duplicated: ", size, chunk_size)
+                    continue
+                hashes.add(hashed_value)
+                spans.append((int(self.file_ids[lo]), start, end, size))
+
+        spans = np.array(spans, dtype=np.int64).reshape(-1, 4)
+        partial = cache.with_suffix(f".{os.getpid()}.partial")
+        with open(partial, "wb") as fd:
+            np.save(fd, spans)
+        os.replace(partial, cache)
+        return spans
+
+    def overlap_documents(self, chunk_size, overlap):
+        """Store counterpart of ``utils.iter_dataset_overlap``.
+
+        Yields the same Documents, in the same order, for a corpus whose
+        files are contiguous.
+        """
+        for file_id, start, end, size in self.overlap_spans(chunk_size, overlap):
+            metadata = {
+                "source": self.names[file_id],
+                "block_size": chunk_size,
+                "size": int(size),
+                "start": int(start),
+                "end": int(end),
+            }
+            text = self.text(start, end + 1)
+            yield Document(text=text.strip(), metadata=metadata)
+
+    def whole_documents(self):
+        """Store counterpart of ``utils.dataset_whole``."""
+        ranges = {}
+        for name, start, end in self.files():
+            ranges.setdefault(name, []).append((start, end))
+
+        docs = []
+        for name in sorted(ranges):
+            rows = [row for start, end in ranges[name] for row in self.rows(start, end)]
+            doc_text = " ".join(rows)
+            metadata = {
+                "source": name,
+                "size": len(doc_text),
+                "start": ranges[name][0][0],
+                "end": ranges[name][-1][1] - 1,
+            }
+            docs.append(Document(text=doc_text.strip(), metadata=metadata))
+        return docs
+
+
+def open_corpus(csv_path, path=None):
+    """Opens the store of a corpus CSV, building it if missing or stale.
+
+    Args:
+        csv_path: Path to the corpus CSV.
+        path: Store directory, ``<csv stem>_store`` next to the CSV by default.
+    """
+    csv_path = Path(csv_path)
+    path = Path(path) if path else csv_path.with_name(f"{csv_path.stem}_store")
+    text = path / "text.bin"
+    if not text.exists() or text.stat().st_mtime < csv_path.stat().st_mtime:
+        return CorpusStore.build(csv_path, path)
+    return CorpusStore(path)
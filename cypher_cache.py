@@ -0,0 +1,209 @@
+import re
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+from langchain.chains import GraphCypherQAChain, LLMChain
+from langchain.chains.graph_qa.cypher import extract_cypher
+from langchain_core.callbacks import CallbackManagerForChainRun
+
+
+def normalize(question):
+    """Normalizes a question for exact-match lookups."""
+    return re.sub(r"\s+", " ", question.strip().lower())
+
+
+def schema_hash(schema):
+    return hashlib.sha256(schema.encode("utf-8")).hexdigest()
+
+
+class CypherCache:
+    """Persistent cache of validated Cypher statements.
+
+    Statements are keyed by a scope (usually the database), the hash of the
+    graph schema given to the Cypher LLM and the normalized question. Only
+    statements that ran without error are stored. The first lookup of a
+    scope with a new schema hash drops the entries of the scope made with
+    any other schema.
+    """
+
+    def __init__(self, path="cypher_cache.sqlite"):
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        self.lock = threading.Lock()
+        self.schemas = {}  # scope -> last seen schema hash
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS cypher ("
+                " scope TEXT, schema TEXT, question TEXT, query TEXT,"
+                " PRIMARY KEY (scope, schema, question))"
+            )
+
+    def _check_schema(self, scope, schema):
+        # called with the lock held
+        if self.schemas.get(scope) == schema:
+            return
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM cypher WHERE scope = ? AND schema != ?", (scope, schema)
+            )
+        self.schemas[scope] = schema
+
+    def get(self, scope, schema, question):
+        """Looks up the Cypher statement generated for a question.
+
+        Args:
+            scope: Name of the database the statement runs on.
+            schema: The graph schema given to the Cypher LLM.
+            question: The user question.
+
+        Returns:
+            The Cypher statement, or None on a miss.
+        """
+        schema = schema_hash(schema)
+        with self.lock:
+            self._check_schema(scope, schema)
+            row = self.conn.execute(
+                "SELECT query FROM cypher"
+                " WHERE scope = ? AND schema = ? AND question = ?",
+                (scope, schema, normalize(question)),
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def put(self, scope, schema, question, query):
+        """Stores the Cypher statement generated for a question.
+
+        Args:
+            scope: Name of the database the statement runs on.
+            schema: The graph schema given to the Cypher LLM.
+            question: The user question.
+            query: The validated Cypher statement.
+        """
+        schema = schema_hash(schema)
+        with self.lock:
+            self._check_schema(scope, schema)
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO cypher VALUES (?, ?, ?, ?)",
+                    (scope, schema, normalize(question), query),
+                )
+
+
+# raw output of the last Cypher generation of each thread, stored by
+# CachedGraphCypherQAChain once the graph has run it
+_generated = threading.local()
+
+
+class CachedCypherGeneration(LLMChain):
+    """Cypher generation chain answering repeated questions from a ``CypherCache``.
+
+    Takes the place of the ``cypher_generation_chain`` of a
+    ``CachedGraphCypherQAChain``, so the parent class runs it as usual.
+    """
+
+    cypher_cache: Any = None
+    cache_scope: str = "neo4j"
+
+    def _call(
+        self,
+        inputs: Dict[str, Any],
+        run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> Dict[str, Any]:
+        cached = self.cypher_cache.get(self.cache_scope, inputs["schema"], inputs["question"])
+        _generated.cypher = None
+        if cached:
+            return {self.output_key: cached}
+        result = super()._call(inputs, run_manager)
+        _generated.cypher = result[self.output_key]
+        return result
+
+
+class CachedGraphCypherQAChain(GraphCypherQAChain):
+    """``GraphCypherQAChain`` that reuses the Cypher of repeated questions.
+
+    On a cache hit the Cypher LLM is skipped and the stored statement is run
+    directly. On a miss the statement is generated and corrected as usual,
+    and stored once the graph has run it without error. Built with
+    ``from_llm``, passing ``cypher_cache`` and ``cache_scope``; the chain
+    itself is ``GraphCypherQAChain``'s, with a ``CachedCypherGeneration``.
+    """
+
+    cypher_cache: Any = None
+    cache_scope: str = "neo4j"
+
+    @classmethod
+    def from_llm(cls, *args, **kwargs):
+        chain = super().from_llm(*args, **kwargs)
+        if chain.cypher_cache is not None:
+            generation = chain.cypher_generation_chain
+            fields = {name: getattr(generation, name) for name in generation.__fields__}
+            chain.cypher_generation_chain = CachedCypherGeneration(
+                **fields, cypher_cache=chain.cypher_cache, cache_scope=chain.cache_scope
+            )
+        return chain
+
+    def _generate_cypher(self, question, callbacks):
+        generated_cypher = self.cypher_generation_chain.run(
+            {"question": question, "schema": self.graph_schema}, callbacks=callbacks
+        )
+        generated_cypher = extract_cypher(generated_cypher)
+        if self.cypher_query_corrector:
+            generated_cypher = self.cypher_query_corrector(generated_cypher)
+        return generated_cypher
+
+    def iter_answer(self, question):
+        """Runs the chain for a question, streaming the answer.
+
+        Yields:
+            ``("stage", name)`` tuples as the chain goes through "generating
+            query" (or "cached query"), "querying graph" and "answering",
+            then ``("token", text)`` tuples as the QA LLM produces them.
+        """
+        cached_cypher = None
+        if self.cypher_cache is not None:
+            cached_cypher = self.cypher_cache.get(
+                self.cache_scope, self.graph_schema, question
+            )
+        if cached_cypher:
+            yield "stage", "cached query"
+            generated_cypher = cached_cypher
+        else:
+            yield "stage", "generating query"
+            generated_cypher = self._generate_cypher(question, None)
+
+        yield "stage", "querying graph"
+        context = []
+        if generated_cypher:
+            context = self.graph.query(generated_cypher)[: self.top_k]
+            if self.cypher_cache is not None and not cached_cypher:
+                self.cypher_cache.put(
+                    self.cache_scope, self.graph_schema, question, generated_cypher
+                )
+
+        yield "stage", "answering"
+        if self.return_direct:
+            yield "token", str(context)
+            return
+        prompt = self.qa_chain.prompt.format_prompt(question=question, context=context)
+        for chunk in self.qa_chain.llm.stream(prompt):
+            # chat models stream message chunks, completion models strings
+            yield "token", getattr(chunk, "content", chunk)
+
+    def _call(
+        self,
+        inputs: Dict[str, Any],
+        run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> Dict[str, Any]:
+        _generated.cypher = None
+        result = super()._call(inputs, run_manager)
+        # the parent raises when the graph rejects the statement, so only
+        # statements that ran get here
+        if self.cypher_cache is not None and _generated.cypher:
+            cypher = extract_cypher(_generated.cypher)
+            if self.cypher_query_corrector:
+                cypher = self.cypher_query_corrector(cypher)
+            if cypher:
+                self.cypher_cache.put(
+                    self.cache_scope, self.graph_schema, inputs[self.input_key], cypher
+                )
+        return result
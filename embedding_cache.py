@@ -0,0 +1,107 @@
+import sqlite3
+import threading
+import numpy as np
+from typing import Any, List
+from utils import hash_string
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+
+class EmbeddingStore:
+    """SQLite store of float32 vectors, keyed by model, kind and text hash."""
+
+    def __init__(self, path="embedding_cache.sqlite"):
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT, kind TEXT, hash TEXT, vector BLOB,"
+                " PRIMARY KEY (model, kind, hash))"
+            )
+
+    def get_many(self, model, kind, hashes):
+        """Returns a dict of the stored vectors among ``hashes``."""
+        found = {}
+        hashes = list(hashes)
+        with self.lock:
+            # stay below SQLite's limit on the number of parameters
+            for i in range(0, len(hashes), 500):
+                batch = hashes[i : i + 500]
+                rows = self.conn.execute(
+                    "SELECT hash, vector FROM embeddings WHERE model = ? AND kind = ?"
+                    f" AND hash IN ({', '.join('?' * len(batch))})",
+                    (model, kind, *batch),
+                ).fetchall()
+                for digest, vector in rows:
+                    found[digest] = np.frombuffer(vector, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, model, kind, items):
+        """Stores ``(hash, vector)`` pairs."""
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)",
+                [
+                    (model, kind, digest, np.asarray(vector, dtype=np.float32).tobytes())
+                    for digest, vector in items
+                ],
+            )
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Embedding model wrapper persisting vectors in an ``EmbeddingStore``.
+
+    Only texts missing from the store are sent to the wrapped model, in
+    batches of its own ``embed_batch_size``, so re-indexing an unchanged
+    corpus makes no embedding call. Query and text embeddings are stored
+    apart, since providers embed them differently.
+
+    Args:
+        embed_model: The embedding model to wrap.
+        path: Path to the SQLite store.
+    """
+
+    _embed_model: Any = PrivateAttr()
+    _store: Any = PrivateAttr()
+
+    def __init__(self, embed_model, path="embedding_cache.sqlite", **kwargs):
+        super().__init__(
+            model_name=embed_model.model_name, embed_batch_size=2048, **kwargs
+        )
+        self._embed_model = embed_model
+        self._store = EmbeddingStore(path)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    def _cached(self, kind, texts, embed_batch):
+        hashes = [hash_string(text) for text in texts]
+        found = self._store.get_many(self.model_name, kind, set(hashes))
+
+        misses = list(dict.fromkeys(h for h in hashes if h not in found))
+        texts_by_hash = dict(zip(hashes, texts))
+        batch_size = self._embed_model.embed_batch_size
+        for i in range(0, len(misses), batch_size):
+            batch = misses[i : i + batch_size]
+            vectors = embed_batch([texts_by_hash[h] for h in batch])
+            self._store.put_many(self.model_name, kind, zip(batch, vectors))
+            found.update(zip(batch, vectors))
+
+        return [list(found[h]) for h in hashes]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        def embed(queries):
+            return [self._embed_model._get_query_embedding(q) for q in queries]
+
+        return self._cached("query", [query], embed)[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._cached("text", texts, self._embed_model._get_text_embeddings)
@@ -0,0 +1,134 @@
+import json
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def eval_key(model, answer, contexts):
+    """Hash of an evaluator model, an answer and its contexts."""
+    h = hashlib.sha256()
+    for part in [model, answer, *contexts]:
+        data = (part or "").encode("utf-8")
+        # length prefixes keep ("ab", "c") and ("a", "bc") apart
+        h.update(len(data).to_bytes(8, "little"))
+        h.update(data)
+    return h.hexdigest()
+
+
+class EvalCache:
+    """Persistent cache of evaluation scores.
+
+    Scores are keyed by the hash of the evaluator model, the answer and its
+    retrieved contexts, so re-running an experiment only re-judges the
+    answers that changed.
+    """
+
+    def __init__(self, path="eval_cache.sqlite"):
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS scores ("
+                " key TEXT PRIMARY KEY, score REAL, passing INTEGER, feedback TEXT)"
+            )
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT score, passing, feedback FROM scores WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        score, passing, feedback = row
+        return {
+            "score": score,
+            "passing": None if passing is None else bool(passing),
+            "feedback": feedback,
+        }
+
+    def put(self, key, score, passing, feedback):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?)",
+                (key, score, None if passing is None else int(passing), feedback),
+            )
+
+
+def answer_contexts(response):
+    """Answer text and retrieved contexts of a response.
+
+    Args:
+        response: A llama_index ``Response``, or the output dict of a
+            ``GraphCypherQAChain`` run with ``return_intermediate_steps``,
+            whose contexts are the records returned by the Cypher query.
+
+    Returns:
+        An ``(answer, contexts)`` tuple.
+    """
+    if isinstance(response, dict):
+        contexts = []
+        for step in response.get("intermediate_steps", []):
+            for record in step.get("context", []):
+                contexts.append(json.dumps(record, ensure_ascii=False, default=str))
+        return response["result"], contexts
+    return response.response, [node.get_content() for node in response.source_nodes]
+
+
+def _evaluate(evaluator, model, response, cache, call):
+    answer, contexts = answer_contexts(response)
+    key = eval_key(model, answer, contexts)
+
+    scored = cache.get(key) if cache is not None else None
+    if scored is None:
+        result = call(evaluator.evaluate, response=answer, contexts=contexts)
+        scored = {
+            "score": result.score,
+            "passing": result.passing,
+            "feedback": result.feedback,
+        }
+        if cache is not None:
+            cache.put(key, **scored)
+    return {**scored, "contexts": contexts}
+
+
+def evaluate_results(
+    evaluator, model, results, cache=None, max_in_flight=4, call=None, on_score=None
+):
+    """Evaluates the responses collected by ``run_benchmark``.
+
+    Evaluation runs after all the questions were asked, with up to
+    ``max_in_flight`` evaluator calls at once, and reads the scores of
+    already judged (answer, contexts) pairs from ``cache``.
+
+    Args:
+        evaluator: A llama_index evaluator (e.g. ``FaithfulnessEvaluator``).
+        model: Name of the evaluator model, part of the cache key.
+        results: Result dicts returned by ``run_benchmark``.
+        cache: An ``EvalCache``, or None.
+        max_in_flight: Maximum number of concurrent evaluator calls.
+        call: Function of ``(fn, **kwargs)`` making the evaluator call, e.g.
+            a rate limiter's ``call``.
+        on_score: Function of ``(result, score)`` called, from the worker
+            threads, as soon as each result is evaluated.
+
+    Returns:
+        A list aligned with ``results``, holding for each result a dict
+        (``score``, ``passing``, ``feedback``, ``contexts``) or the
+        exception raised while evaluating it. Failed queries get None.
+    """
+    call = call or (lambda fn, **kwargs: fn(**kwargs))
+
+    def evaluate(result):
+        score = None
+        if result["error"] is None:
+            try:
+                score = _evaluate(evaluator, model, result["response"], cache, call)
+            except Exception as e:
+                score = e
+        if on_score is not None:
+            on_score(result, score)
+        return score
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        return list(pool.map(evaluate, results))
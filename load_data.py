@@ -5,12 +5,16 @@
 
 
 import os
+import hashlib
 import re
 import time
+import argparse
 import pandas as pd
 from tqdm import tqdm
 from pathlib import Path
+from functools import partial
 from itertools import product
+from multiprocessing import Pool
 
 from langchain.graphs.graph_document import (
     Node,
@@ -19,17 +23,7 @@ from langchain.graphs.graph_document import (
 )
 
 
-input_dir = Path("data__4096_0_plain")
-
-
-input_dir = Path(f"graph")
-
-assert input_dir.exists()
-
-files = list(input_dir.rglob("*.csv"))
-
-
-from neo4j import GraphDatabase
+from neo4j import GraphDatabase, exceptions
 
 # Neo4j connection from environment variables
 uri = os.environ.get("NEO4J_URL", "bolt://localhost:7687")
@@ -88,33 +82,258 @@ def insert_into_neo4j__prompted(data):
     driver.close()
 
 
-for f in files:
-    df = pd.read_csv(f)
+def normalize(df):
+    """Applies the label and name normalization used by the graph loaders."""
+    for column in ["subject_name", "object_name", "relationship"]:
+        df[column] = df[column].astype(str).str.replace("-", "_", regex=False)
+    for column in ["subject_type", "object_type"]:
+        df[column] = df[column].astype(str).str.replace(" ", "_", regex=False)
+    for column in ["subject_name", "object_name", "relationship"]:
+        df[column] = df[column].astype(str).str.replace(" ", "_", regex=False)
+    return df
 
-    df["subject_name"] = (
-        df["subject_name"].astype(str).apply(lambda x: x.replace("-", "_"))
-    )
-    df["object_name"] = (
-        df["object_name"].astype(str).apply(lambda x: x.replace("-", "_"))
-    )
-    df["relationship"] = (
-        df["relationship"].astype(str).apply(lambda x: x.replace("-", "_"))
-    )
-    df["subject_type"] = (
-        df["subject_type"].astype(str).apply(lambda x: x.replace(" ", "_"))
+
+def _run_batch(tx, query, rows):
+    tx.run(query, rows=rows).consume()
+
+
+def insert_into_neo4j__batched(driver, df, batch_size=1000):
+    """Loads prompted triplets with parameterized UNWIND batches.
+
+    Rows are grouped by (subject_type, relationship, object_type), since
+    labels and relationship types cannot be parameters, and each batch of
+    ``batch_size`` rows is written in its own explicit transaction.
+
+    Args:
+        driver: A neo4j driver, shared by all the calls of a run.
+        df: Normalized triplets (see ``normalize``).
+        batch_size: Number of rows per transaction.
+
+    Returns:
+        The number of rows written.
+    """
+    rows = 0
+    columns = ["subject_type", "relationship", "object_type"]
+    with driver.session() as session:
+        for (subject_type, relationship, object_type), group in df.groupby(
+            columns, sort=False
+        ):
+            query = (
+                "UNWIND $rows AS row "
+                f"MERGE (s:`{subject_type}` {{name: row.subject_name}}) "
+                f"MERGE (o:`{object_type}` {{name: row.object_name}}) "
+                f"MERGE (s)-[:`{relationship}`]->(o)"
+            )
+            # a consistent lock order makes concurrent MERGEs less likely
+            # to deadlock, and execute_write retries the deadlocks that
+            # still happen
+            group = group.sort_values(["subject_name", "object_name"])
+            records = group[["subject_name", "object_name"]].to_dict("records")
+            for i in range(0, len(records), batch_size):
+                session.execute_write(_run_batch, query, records[i : i + batch_size])
+            rows += len(records)
+    return rows
+
+
+def file_labels(path):
+    """Returns the normalized subject and object types of a graph CSV."""
+    types = pd.read_csv(path, usecols=["subject_type", "object_type"])
+    labels = set()
+    for column in types.columns:
+        labels.update(types[column].astype(str).str.replace(" ", "_", regex=False))
+    return labels
+
+
+def create_name_indexes(driver, labels):
+    """Creates a uniqueness constraint on ``name`` for every label.
+
+    Labels whose existing nodes already break uniqueness get a plain index
+    instead, which still saves MERGE from scanning all nodes of the label.
+    Without the constraint, concurrent MERGEs of the same name are not
+    atomic, so files with these labels must not be loaded in parallel.
+
+    Args:
+        driver: A neo4j driver.
+        labels: The labels of the input files.
+
+    Returns:
+        The set of labels left without a uniqueness constraint.
+    """
+    unconstrained = set()
+    with driver.session() as session:
+        for label in sorted(labels):
+            try:
+                session.run(
+                    f"CREATE CONSTRAINT IF NOT EXISTS FOR (n:`{label}`) "
+                    "REQUIRE n.name IS UNIQUE"
+                ).consume()
+            except (exceptions.ClientError, exceptions.DatabaseError):
+                # ConstraintCreationFailed, raised on existing duplicates, is
+                # a DatabaseError
+                session.run(
+                    f"CREATE INDEX IF NOT EXISTS FOR (n:`{label}`) ON (n.name)"
+                ).consume()
+                unconstrained.add(label)
+        session.run("CALL db.awaitIndexes()").consume()
+    return unconstrained
+
+
+CLINICAL_COLUMNS = {
+    "chunk1": "subject_name",
+    "entity1": "subject_type",
+    "relation": "relationship",
+    "chunk2": "object_name",
+    "entity2": "object_type",
+}
+
+
+def read_triplets(path):
+    """Reads a graph CSV or a clinical RE CSV as normalized triplets.
+
+    Clinical RE rows (``relation``, ``entity1``, ``chunk1``, ...) are mapped
+    to the graph columns and keep their ``confidence``.
+    """
+    try:
+        df = pd.read_csv(path)
+    except pd.errors.EmptyDataError:
+        return None
+    if "chunk1" in df.columns:
+        df = df.rename(columns=CLINICAL_COLUMNS)
+    else:
+        df["confidence"] = float("nan")
+    columns = list(CLINICAL_COLUMNS.values()) + ["confidence"]
+    return normalize(df[columns].copy())
+
+
+def node_ids(labels, names):
+    """Stable ids of (label, name) entities, the identity MERGE uses."""
+    keys = labels + "\x1f" + names
+    return keys.map(lambda key: hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+
+def export_admin_import(files, output_dir):
+    """Writes ``neo4j-admin database import`` files for a full rebuild.
+
+    Entities are deduplicated on (label, name) and relationships on (start,
+    type, end, confidence), the same identities the MERGE loaders use.
+
+    Args:
+        files: Graph and clinical RE CSVs.
+        output_dir: Directory for ``nodes.csv`` and ``relationships.csv``.
+
+    Returns:
+        The number of nodes and relationships written.
+    """
+    frames = [read_triplets(f) for f in files]
+    df = pd.concat([f for f in frames if f is not None], ignore_index=True)
+
+    subjects = df[["subject_type", "subject_name"]].set_axis(["label", "name"], axis=1)
+    objects = df[["object_type", "object_name"]].set_axis(["label", "name"], axis=1)
+    nodes = pd.concat([subjects, objects]).drop_duplicates(ignore_index=True)
+    nodes["id"] = node_ids(nodes["label"], nodes["name"])
+
+    relationships = pd.DataFrame(
+        {
+            ":START_ID": node_ids(df["subject_type"], df["subject_name"]),
+            ":END_ID": node_ids(df["object_type"], df["object_name"]),
+            ":TYPE": df["relationship"],
+            "confidence:float": df["confidence"],
+        }
+    ).drop_duplicates()
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    nodes[["id", "name", "label"]].set_axis(
+        ["id:ID", "name", ":LABEL"], axis=1
+    ).to_csv(output_dir / "nodes.csv", index=None)
+    relationships.to_csv(output_dir / "relationships.csv", index=None)
+    return len(nodes), len(relationships)
+
+
+# one driver per worker process
+worker_driver = None
+
+
+def init_worker():
+    global worker_driver
+    worker_driver = GraphDatabase.driver(uri, auth=(username, password))
+
+
+def load_file(path, batch_size):
+    df = normalize(pd.read_csv(path))
+    return insert_into_neo4j__batched(worker_driver, df, batch_size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load graph CSVs into Neo4j.")
+    parser.add_argument(
+        "--input-dir",
+        nargs="+",
+        default=["graph"],
+        help="Directories of graph (or, for --export, clinical RE) CSVs",
     )
-    df["object_type"] = (
-        df["object_type"].astype(str).apply(lambda x: x.replace(" ", "_"))
+    parser.add_argument(
+        "--batch-size", type=int, default=1000, help="Rows per UNWIND transaction"
     )
-    df["subject_name"] = (
-        df["subject_name"].astype(str).apply(lambda x: x.replace(" ", "_"))
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(), help="Files loaded in parallel"
     )
-    df["object_name"] = (
-        df["object_name"].astype(str).apply(lambda x: x.replace(" ", "_"))
+    parser.add_argument(
+        "--export",
+        metavar="DIR",
+        help="Write neo4j-admin import files to DIR instead of loading over Bolt",
     )
-    df["relationship"] = (
-        df["relationship"].astype(str).apply(lambda x: x.replace(" ", "_"))
+    args = parser.parse_args()
+
+    files = []
+    for input_dir in map(Path, args.input_dir):
+        assert input_dir.exists()
+        files.extend(input_dir.rglob("*.csv"))
+
+    if args.export:
+        tic = time.time()
+        n_nodes, n_relationships = export_admin_import(files, args.export)
+        print(
+            f"nodes: {n_nodes}, relationships: {n_relationships}, "
+            f"elapsed: {time.time() - tic:.1f}s"
+        )
+        print(
+            "import with: neo4j-admin database import full neo4j --overwrite-destination "
+            f"--nodes={args.export}/nodes.csv "
+            f"--relationships={args.export}/relationships.csv"
+        )
+        raise SystemExit
+
+    tic = time.time()
+    labels = {f: file_labels(f) for f in files}
+    all_labels = set().union(*labels.values())
+    driver = GraphDatabase.driver(uri, auth=(username, password))
+    unconstrained = create_name_indexes(driver, all_labels)
+    driver.close()
+    print(
+        f"indexed labels: {len(all_labels)}, "
+        f"without constraint: {len(unconstrained)}, elapsed: {time.time() - tic:.1f}s"
     )
-    data = df.values.tolist()
 
-    insert_into_neo4j__prompted(data)
+    # files touching a label without a constraint are loaded one after the
+    # other, once the others are done, so no two MERGEs of it run at once
+    sequential = [f for f in files if labels[f] & unconstrained]
+    parallel = [f for f in files if not labels[f] & unconstrained]
+
+    total = 0
+    tic = time.time()
+    load = partial(load_file, batch_size=args.batch_size)
+    with tqdm(total=len(files)) as pbar:
+        with Pool(args.workers, initializer=init_worker) as pool:
+            for rows in pool.imap_unordered(load, parallel):
+                total += rows
+                pbar.update(1)
+        if sequential:
+            init_worker()
+            for f in sequential:
+                total += load(f)
+                pbar.update(1)
+            worker_driver.close()
+
+    elapsed = time.time() - tic
+    print(f"rows: {total}, elapsed: {elapsed:.1f}s, rows/s: {total / max(elapsed, 1e-9):.1f}")
@@ -2,7 +2,8 @@ import os
 import time
 import pandas as pd
 from langchain_community.graphs import Neo4jGraph
-from langchain.chains import GraphCypherQAChain
+from cypher_cache import CypherCache, CachedGraphCypherQAChain
+from schema_cache import with_schema_cache
 from langchain_community.chat_models import ChatOllama
 from langchain_openai import ChatOpenAI
 
@@ -11,6 +12,7 @@ from langchain_google_genai import ChatGoogleGenerativeAI
 
 cypher_model = ChatOpenAI(model="gpt-3.5-turbo", temperature=0.0)
 qa_model = ChatOpenAI(model="gpt-3.5-turbo", temperature=0.0)
+cypher_cache = CypherCache("cypher_cache.sqlite")
 
 # Credentials loaded from environment variables.
 # Set NEO4J_AUTH_MAP as a JSON string, e.g.:
@@ -32,13 +34,17 @@ for database, (creds) in auth_map.items():
     print(database, username, url)
     storage_path = f"./storage_graph_{database}__2048"
 
-    graph = Neo4jGraph(url=url, username=username, password=password, database="neo4j")
-    auth_map[database]["chain"] = GraphCypherQAChain.from_llm(
+    graph = with_schema_cache(Neo4jGraph)(
+        url=url, username=username, password=password, database="neo4j"
+    )
+    auth_map[database]["chain"] = CachedGraphCypherQAChain.from_llm(
         graph=graph,
         cypher_llm=cypher_model,
         qa_llm=qa_model,
         validate_cypher=True,
         verbose=True,
+        cypher_cache=cypher_cache,
+        cache_scope=database,
     )
 
 queries = [
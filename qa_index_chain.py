@@ -1,12 +1,15 @@
 import os
+import csv
 import json
 import time
+import threading
 import logging
 import pandas as pd
 from tqdm import tqdm
 from pathlib import Path
 from multiprocessing import Pool
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from llama_index.core import Settings
 from llama_index.llms.gemini import Gemini
 from llama_index.llms.openai import OpenAI
@@ -27,10 +30,17 @@ from llama_index.core.retrievers import KnowledgeGraphRAGRetriever
 from llama_index.core.query_engine import KnowledgeGraphQueryEngine
 from llama_index.core.indices.loading import load_indices_from_storage
 from llama_index.core.evaluation import FaithfulnessEvaluator
+from rate_limit import gemini_limiter
+from benchmark import run_benchmark
+from evaluation import EvalCache, answer_contexts, evaluate_results
+from embedding_cache import CachedEmbedding
+from schema_cache import with_schema_cache
+from ann_index import IVFIndex, as_ann_query_engine
 
 llm = Gemini(temperature=0, timeout=60)
-embedding_llm = GeminiEmbedding(model="models/embedding-001")
+embedding_llm = CachedEmbedding(GeminiEmbedding(model="models/embedding-001"))
 evaluator = FaithfulnessEvaluator(llm=llm)
+GEMINI = gemini_limiter()
 
 Settings.llm = llm
 Settings.embed_model = embedding_llm
@@ -39,6 +49,9 @@ Settings.chunk_size = 512
 INCLUDE_TEXT = True
 VERBOSE = False
 GLOBAL = True
+CONCURRENCY = 1
+EVAL_IN_FLIGHT = 4
+WARMUP = 1
 
 database = "neo4j"
 username = "neo4j"
@@ -56,38 +69,44 @@ if not auth_map_json:
 auth_map = json.loads(auth_map_json)
 
 
-for database, (creds) in auth_map.items():
+PARAMETERS = [
+    (True, True, True),
+    (False, True, False),
+    (True, True, False),
+    (False, False, False),
+]
+
+
+def load_database(database, creds):
+    """Loads the storage of a database and builds its query engines.
 
+    Called by the worker of the database on first use, so databases load
+    in parallel and only when they are queried.
+    """
     username, password, url = creds.values()
     print(database, username, url)
     storage_path = f"./storage_graph_{database}__2048"
     storage_path = f"./storage_graph_{database}_overlap_286__2048"
 
-    graph_store = Neo4jGraphStore(
+    graph_store = with_schema_cache(Neo4jGraphStore)(
         username=username, password=password, url=url, database="neo4j", timeout=60
     )
     storage_context = StorageContext.from_defaults(
         graph_store=graph_store,
         persist_dir=storage_path,
     )
-    auth_map[database]["storage"] = storage_context
     index = load_indices_from_storage(storage_context=storage_context)[0]
 
-    auth_map[database]["index"] = index
-    auth_map[database]["strategy"] = {}
+    ann = IVFIndex(Path(storage_path) / "ann")
+    ann.sync(index.index_struct.embedding_dict)
+    ann.save()
+    strategies = {}
 
-    parameters = [
-        (True, True, True),
-        (False, True, False),
-        (True, True, False),
-        (False, False, False),
-    ]
+    for i, param in enumerate(PARAMETERS):
 
-    for i, param in enumerate(parameters):
+        strategies[f"verbo_based__{i}"] = as_ann_query_engine(index, ann)
 
-        auth_map[database]["strategy"][f"verbo_based__{i}"] = index.as_query_engine()
-
-        auth_map[database]["strategy"][f"keyword_based__{i}"] = index.as_query_engine(
+        strategies[f"keyword_based__{i}"] = index.as_query_engine(
             retriever_mode="keyword",
             response_mode="tree_summarize",
             verbose=VERBOSE,
@@ -95,7 +114,9 @@ for database, (creds) in auth_map.items():
             explore_global_knowledge=GLOBAL,
         )
 
-        auth_map[database]["strategy"][f"hybrid__{i}"] = index.as_query_engine(
+        strategies[f"hybrid__{i}"] = as_ann_query_engine(
+            index,
+            ann,
             include_text=True,
             response_mode="tree_summarize",
             embedding_mode="hybrid",
@@ -114,11 +135,9 @@ for database, (creds) in auth_map.items():
             explore_global_knowledge=GLOBAL,
         )
 
-        auth_map[database]["strategy"][f"rag__{i}"] = RetrieverQueryEngine.from_args(
-            graph_rag_retriever
-        )
+        strategies[f"rag__{i}"] = RetrieverQueryEngine.from_args(graph_rag_retriever)
 
-        auth_map[database]["strategy"][f"kg__{i}"] = KnowledgeGraphQueryEngine(
+        strategies[f"kg__{i}"] = KnowledgeGraphQueryEngine(
             storage_context=storage_context,
             llm=llm,
             refresh_schema=True,
@@ -127,6 +146,9 @@ for database, (creds) in auth_map.items():
             explore_global_knowledge=GLOBAL,
         )
 
+    return strategies
+
+
 questions = [
     "Tell me about the relationship between Vitamind D and Covid?",
     "Qual é a relação entre a severidade, recuperação e infecção à COVID 19, insuficiência e deficiência de Vitamina D e o uso de protetor solar?",
@@ -147,36 +169,91 @@ questions = [
     "¿Cuál es la relación entre la infección por COVID-19, la insuficiencia y la deficiencia de vitamina D?",
 ]
 
-answers_map = []
+RESULT_COLUMNS = [
+    "db",
+    "strategy",
+    "question",
+    "answer",
+    "answer_context",
+    "eval",
+    "eval_context",
+    "time",
+]
+results_fd = open("QA_global_all_total_en.csv", "w", newline="", encoding="utf-8")
+results_writer = csv.DictWriter(results_fd, fieldnames=RESULT_COLUMNS)
+results_writer.writeheader()
+results_lock = threading.Lock()
+eval_cache = EvalCache("eval_cache.sqlite")
+
+
+def write_cell(result, fact_score):
+    """Appends an evaluated (db, strategy, question) cell to the results file."""
+    if result["error"] is not None:
+        print(result["db"], result["strategy"], result["error"])
+        return
+    if isinstance(fact_score, Exception):
+        print(result["db"], result["strategy"], fact_score)
+        return
+    response = result["response"]
+    answer = {
+        "db": result["db"],
+        "strategy": result["strategy"],
+        "question": result["question"],
+        "answer": answer_contexts(response)[0],
+        "answer_context": response,
+        "eval": fact_score["score"],
+        "eval_context": "\n".join(fact_score["contexts"]),
+        "time": result["time"],
+    }
+    with results_lock:
+        results_writer.writerow(answer)
+        results_fd.flush()
+
+
+def run_database(database, creds):
+    """Benchmarks and evaluates the strategies of a database.
+
+    Returns:
+        Its benchmark summary, or a single row with the error that stopped
+        it, so one failing database doesn't lose the others' results.
+    """
+    try:
+        strategies = load_database(database, creds)
+        engines = {(database, name): stg for name, stg in strategies.items()}
+        results, summary = run_benchmark(
+            engines,
+            questions,
+            concurrency=CONCURRENCY,
+            warmup=WARMUP,
+            call=GEMINI.call,
+        )
+        evaluate_results(
+            evaluator,
+            llm.model,
+            results,
+            cache=eval_cache,
+            max_in_flight=EVAL_IN_FLIGHT,
+            call=GEMINI.call,
+            on_score=write_cell,
+        )
+    except Exception as e:
+        print(f"FAIL database {database}, \n{e}")
+        return pd.DataFrame([{"db": database, "error": repr(e)}])
+    return summary.assign(error=None)
+
+
 t1 = time.time()
-for db, exp in auth_map.items():
-    for stg_name, stg in exp.get("strategy", {}).items():
-
-        for question in questions:
-
-            try:
-                tic = time.time()
-                response = stg.query(question)
-                tac = time.time() - tic
-                fact_score = evaluator.evaluate_response(response=response)
-                answer = {
-                    "db": db,
-                    "strategy": stg_name,
-                    "question": question,
-                    "answer": response.response,
-                    "answer_context": response,
-                    "eval": fact_score.score,
-                    "eval_context": "\n".join(fact_score.contexts),
-                    "time": tac,
-                }
-                answers_map.append(answer)
-            except Exception as e:
-                print(db, stg_name, e)
-                time.sleep(1)
+# one worker per database; the Gemini limiter is shared, so the API rate
+# limit holds across all of them
+try:
+    with ThreadPoolExecutor(max_workers=len(auth_map)) as pool:
+        summaries = list(pool.map(lambda item: run_database(*item), auth_map.items()))
+finally:
+    results_fd.close()
 
-print("elapsed: ", time.time() - t1)
+summary = pd.concat(summaries, ignore_index=True)
+summary.to_csv("benchmark_global_all_total_en.csv", index=None)
+print(summary)
 
-pd.DataFrame(answers_map).to_csv(
-    f"QA_global_all_total_en.csv",
-    index=None,
-)
+print("elapsed: ", time.time() - t1)
+print("rate limits: ", GEMINI.report())
@@ -0,0 +1,208 @@
+import time
+import random
+import threading
+from collections import Counter
+
+
+class TokenBucket:
+    """Thread-safe token bucket.
+
+    Args:
+        rate: Tokens added per second.
+        capacity: Maximum number of tokens, i.e. the allowed burst.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Blocks until a token is available and takes it."""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def set_rate(self, rate):
+        with self.lock:
+            self._refill()
+            self.rate = rate
+
+
+class RateLimiter:
+    """Rate limiting and retry policy for one provider (Gemini, Neo4j, ...).
+
+    Calls go through a token bucket whose rate is adapted to the provider's
+    quota: it is halved on every throttled call (down to ``min_rate``) and
+    grows back by a twentieth of ``rate`` on every successful one. Failed
+    calls are retried with exponential backoff and full jitter, as long as
+    the retry budget allows it: at most ``min_retries`` retries plus
+    ``budget_ratio`` retries per successful call, over the limiter's life.
+
+    Args:
+        name: Provider name, used in reports.
+        rate: Maximum calls per second.
+        burst: Maximum number of calls made back to back.
+        min_rate: Lowest rate reached by throttling.
+        max_retries: Maximum retries of a single call.
+        base_delay: Backoff of the first retry, in seconds.
+        max_delay: Largest backoff, in seconds.
+        budget_ratio: Retries allowed per successful call.
+        min_retries: Retries allowed before any call succeeded.
+        retry_on: Exception types of transient failures.
+        throttle_on: Exception types raised when the provider throttles.
+    """
+
+    def __init__(
+        self,
+        name,
+        rate,
+        burst=1,
+        min_rate=None,
+        max_retries=5,
+        base_delay=1.0,
+        max_delay=60.0,
+        budget_ratio=0.2,
+        min_retries=10,
+        retry_on=(),
+        throttle_on=(),
+    ):
+        self.name = name
+        self.max_rate = rate
+        self.min_rate = min_rate or rate / 32
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget_ratio = budget_ratio
+        self.min_retries = min_retries
+        self.retry_on = tuple(retry_on)
+        self.throttle_on = tuple(throttle_on)
+        self.stats = Counter()
+        self.lock = threading.Lock()
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def _spend_retry(self):
+        with self.lock:
+            budget = self.min_retries + self.budget_ratio * self.stats["success"]
+            if self.stats["retried"] >= budget:
+                return False
+            self.stats["retried"] += 1
+            return True
+
+    def call(self, fn, *args, **kwargs):
+        """Calls ``fn(*args, **kwargs)`` under the rate limit, with retries.
+
+        Raises:
+            The last exception raised by ``fn`` once the call's retries or
+            the retry budget are exhausted, or right away for exceptions that
+            are neither transient nor throttling.
+        """
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            try:
+                result = fn(*args, **kwargs)
+            except self.throttle_on + self.retry_on as e:
+                with self.lock:
+                    if isinstance(e, self.throttle_on):
+                        self.stats["throttled"] += 1
+                        self.bucket.set_rate(max(self.min_rate, self.bucket.rate / 2))
+                    else:
+                        self.stats["failed"] += 1
+                if attempt >= self.max_retries or not self._spend_retry():
+                    with self.lock:
+                        self.stats["gave_up"] += 1
+                    raise
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+
+            with self.lock:
+                self.stats["success"] += 1
+                step = self.max_rate / 20
+                self.bucket.set_rate(min(self.max_rate, self.bucket.rate + step))
+            return result
+
+    def scale(self, factor):
+        """Scales the rate limits, e.g. to share a quota between processes."""
+        with self.lock:
+            self.max_rate *= factor
+            self.min_rate *= factor
+            self.bucket.set_rate(self.bucket.rate * factor)
+
+    def report(self):
+        """Returns the call counters and current rate, for tuning."""
+        with self.lock:
+            return {"provider": self.name, "rate": self.bucket.rate, **self.stats}
+
+
+LIMITERS = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name, **kwargs):
+    """Returns the process-wide limiter of a provider, creating it if needed.
+
+    Args:
+        name: Provider name.
+        **kwargs: ``RateLimiter`` arguments, used on creation only.
+    """
+    with _limiters_lock:
+        if name not in LIMITERS:
+            LIMITERS[name] = RateLimiter(name, **kwargs)
+        return LIMITERS[name]
+
+
+def gemini_limiter():
+    """Returns the shared limiter for Gemini calls.
+
+    Query engines also read the graph store, so transient Neo4j errors are
+    retried as well. Defaults follow the gemini-1.0-pro quota (60 RPM).
+    """
+    from google.api_core import exceptions as google_exceptions
+    from neo4j import exceptions as neo4j_exceptions
+
+    return get_limiter(
+        "gemini",
+        rate=1.0,
+        burst=5,
+        throttle_on=(google_exceptions.ResourceExhausted,),
+        retry_on=(
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.DeadlineExceeded,
+            google_exceptions.InternalServerError,
+            neo4j_exceptions.ServiceUnavailable,
+            neo4j_exceptions.TransientError,
+        ),
+    )
+
+
+def neo4j_limiter():
+    """Returns the shared limiter for Neo4j writes."""
+    from neo4j import exceptions as neo4j_exceptions
+
+    return get_limiter(
+        "neo4j",
+        rate=100.0,
+        burst=100,
+        retry_on=(
+            neo4j_exceptions.ServiceUnavailable,
+            neo4j_exceptions.SessionExpired,
+            neo4j_exceptions.TransientError,
+        ),
+    )
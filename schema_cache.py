@@ -0,0 +1,105 @@
+import inspect
+import threading
+from collections import defaultdict
+
+
+class SchemaCache:
+    """Process-wide graph schema cache, shared by all the clients of a database.
+
+    A schema is introspected once per database and served from memory until
+    the database version changes. The version is a write counter read from
+    the count store (node and relationship counts), so checking it costs two
+    constant-time queries instead of the APOC introspection.
+    """
+
+    def __init__(self):
+        self.entries = {}  # key -> (version, schema)
+        self.locks = defaultdict(threading.Lock)
+        self.lock = threading.Lock()
+
+    def get(self, key, version, introspect):
+        """Returns the schema of a database.
+
+        Args:
+            key: Identifies the database and schema format.
+            version: Function returning the current database version.
+            introspect: Function returning the schema, called on a miss.
+
+        Returns:
+            The value returned by ``introspect``.
+        """
+        with self.lock:
+            key_lock = self.locks[key]
+        # concurrent clients of the same database share one introspection
+        with key_lock:
+            current = version()
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == current:
+                return entry[1]
+            schema = introspect()
+            self.entries[key] = (current, schema)
+            return schema
+
+    def invalidate(self, key=None):
+        with self.lock:
+            if key is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
+
+
+SCHEMAS = SchemaCache()
+
+_subclasses = {}
+
+
+def with_schema_cache(graph_cls):
+    """Returns a subclass of a Neo4j graph class reading its schema from ``SCHEMAS``.
+
+    Works with the llama_index ``Neo4jGraphStore`` and the langchain
+    ``Neo4jGraph``, which both introspect the schema when constructed and
+    on ``refresh_schema``, and store it in ``schema`` and
+    ``structured_schema``.
+
+    Args:
+        graph_cls: The graph class.
+
+    Returns:
+        The cached subclass, created once per class.
+    """
+    if graph_cls in _subclasses:
+        return _subclasses[graph_cls]
+
+    signature = inspect.signature(graph_cls.__init__)
+
+    class CachedSchemaGraph(graph_cls):
+        def __init__(self, *args, **kwargs):
+            arguments = signature.bind(self, *args, **kwargs)
+            arguments.apply_defaults()
+            # schemas are formatted differently by each graph class
+            self._schema_key = (
+                graph_cls,
+                arguments.arguments.get("url"),
+                arguments.arguments.get("database"),
+            )
+            super().__init__(*args, **kwargs)
+
+        def _graph_version(self):
+            nodes = self.query("MATCH (n) RETURN count(n) AS count")[0]["count"]
+            rels = self.query("MATCH ()-[r]->() RETURN count(r) AS count")[0]["count"]
+            return nodes, rels
+
+        def _introspect(self):
+            super().refresh_schema()
+            return self.schema, self.structured_schema
+
+        def refresh_schema(self):
+            self.schema, self.structured_schema = SCHEMAS.get(
+                self._schema_key, self._graph_version, self._introspect
+            )
+
+    CachedSchemaGraph.__name__ = CachedSchemaGraph.__qualname__ = (
+        f"CachedSchema{graph_cls.__name__}"
+    )
+    _subclasses[graph_cls] = CachedSchemaGraph
+    return CachedSchemaGraph
@@ -0,0 +1,223 @@
+import re
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+def normalize(query):
+    """Normalizes a question for exact-match lookups."""
+    return re.sub(r"\s+", " ", query.strip().lower())
+
+
+class AnswerCache:
+    """Process-wide answer cache in front of the QA chain.
+
+    Answers are looked up by normalized question and, when a ``threshold``
+    is given, by embedding similarity. Semantic matching is off by default:
+    questions differing by one clinical term ("vitamin d deficiency" and
+    "vitamin d insufficiency") embed almost identically, so the threshold
+    must be checked against such pairs for the embedding model used.
+
+    Entries expire after ``ttl`` seconds and the least recently used ones
+    are evicted beyond ``max_size``. The whole cache is dropped when
+    ``version()`` (e.g. graph node and relationship counts) changes, which
+    is checked at most every ``version_interval`` seconds, or when
+    ``invalidate`` is called. Concurrent calls for the same question share
+    a single computation.
+
+    Args:
+        embed: Function returning the embedding of a question.
+        max_size: Maximum number of entries.
+        ttl: Entry lifetime, in seconds.
+        threshold: Minimum cosine similarity of a semantic match, or None
+            to only match exact questions.
+        version: Function returning the current graph version, or None.
+        version_interval: Minimum delay between version checks, in seconds.
+    """
+
+    def __init__(
+        self,
+        embed=None,
+        max_size=1024,
+        ttl=3600,
+        threshold=None,
+        version=None,
+        version_interval=30,
+    ):
+        # questions are only embedded when semantic matching is on
+        self.embed = embed if threshold is not None else None
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self.version = version
+        self.version_interval = version_interval
+        self.entries = OrderedDict()  # key -> (created, vector, answer)
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.current_version = None
+        self.version_checked = 0.0
+
+    def invalidate(self):
+        with self.lock:
+            self.entries.clear()
+
+    def _check_version(self):
+        if self.version is None:
+            return
+        now = time.monotonic()
+        if now - self.version_checked < self.version_interval:
+            return
+        self.version_checked = now
+        version = self.version()
+        with self.lock:
+            if version != self.current_version:
+                self.entries.clear()
+                self.current_version = version
+
+    def _lookup(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > self.ttl:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry[2]
+
+    def _lookup_similar(self, vector):
+        now = time.monotonic()
+        keys, vectors = [], []
+        for key, (created, entry_vector, _) in self.entries.items():
+            if entry_vector is not None and now - created <= self.ttl:
+                keys.append(key)
+                vectors.append(entry_vector)
+        if not keys:
+            return None
+        scores = np.stack(vectors) @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        self.entries.move_to_end(keys[best])
+        return self.entries[keys[best]][2]
+
+    def _embed(self, query):
+        vector = np.asarray(self.embed(query), dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        return vector
+
+    def _store(self, key, vector, answer):
+        # called with the lock held
+        self.entries[key] = (time.monotonic(), vector, answer)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def get(self, query):
+        """Returns the cached answer of a question, or None on a miss.
+
+        Returns:
+            An ``(answer, vector)`` tuple, ``vector`` being the question
+            embedding to pass back to ``put`` after a miss.
+        """
+        self._check_version()
+        with self.lock:
+            answer = self._lookup(normalize(query))
+        if answer is not None or self.embed is None:
+            return answer, None
+        vector = self._embed(query)
+        with self.lock:
+            return self._lookup_similar(vector), vector
+
+    def put(self, query, answer, vector=None):
+        """Stores the answer of a question computed outside ``get_or_compute``.
+
+        Args:
+            query: The question.
+            answer: The answer.
+            vector: The question embedding returned by ``get``, if any.
+        """
+        if vector is None and self.embed is not None:
+            vector = self._embed(query)
+        with self.lock:
+            self._store(normalize(query), vector, answer)
+
+    def claim(self, query):
+        """Looks a question up, claiming its computation on a miss.
+
+        The first caller to miss a question owns its computation and must
+        hand the answer, or the error, to ``release``. Callers missing it
+        meanwhile get the owner's future.
+
+        Returns:
+            An ``(answer, future)`` tuple: the cached answer and None on a
+            hit, None and the owner's future while another caller computes
+            it, and ``(None, None)`` to the owner.
+        """
+        self._check_version()
+        key = normalize(query)
+
+        with self.lock:
+            answer = self._lookup(key)
+            if answer is not None:
+                return answer, None
+            if key in self.inflight:
+                return None, self.inflight[key][0]
+            future = Future()
+            self.inflight[key] = (future, None)
+
+        if self.embed is not None:
+            try:
+                vector = self._embed(query)
+            except BaseException as e:
+                self.release(query, error=e)
+                raise
+            with self.lock:
+                answer = self._lookup_similar(vector)
+                self.inflight[key] = (future, vector)
+            if answer is not None:
+                self.release(query, answer)
+                return answer, None
+        return None, None
+
+    def release(self, query, answer=None, error=None):
+        """Stores the answer of a claimed question and hands it to the callers
+        waiting for it.
+
+        Args:
+            query: The question passed to ``claim``.
+            answer: The answer, if computed.
+            error: The exception raised instead, passed on to the waiting
+                callers; nothing is stored.
+        """
+        key = normalize(query)
+        with self.lock:
+            future, vector = self.inflight.pop(key)
+            if error is None:
+                self._store(key, vector, answer)
+        if error is None:
+            future.set_result(answer)
+        else:
+            future.set_exception(error)
+
+    def get_or_compute(self, query, compute):
+        """Returns the cached answer of a question, computing it on a miss.
+
+        Args:
+            query: The question.
+            compute: Function returning the answer, called on a miss.
+        """
+        answer, future = self.claim(query)
+        if answer is not None:
+            return answer
+        if future is not None:
+            return future.result()
+
+        try:
+            answer = compute()
+        except BaseException as e:
+            self.release(query, error=e)
+            raise
+        self.release(query, answer)
+        return answer
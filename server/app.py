@@ -1,8 +1,10 @@
 import os
+import time
 import tempfile
 import streamlit as st
 from streamlit_chat import message
-from rag import ChatPDF
+from rag import ChatPDF, pool
+from pdf_ingest import md5sum
 
 st.set_page_config(page_title="ChatPDF")
 
@@ -17,6 +19,36 @@ def display_messages():
 MAX_QUERY_LENGTH = 2000
 
 
+def stream_answer(user_text):
+    """Renders the stages and tokens of an answer as they arrive.
+
+    Time to first token and total time are shown under the answer and kept
+    in ``st.session_state["latencies"]``.
+    """
+    tic = time.time()
+    first_token = None
+    tokens = []
+    status = st.status("Thinking")
+    answer = st.empty()
+    for kind, value in st.session_state["assistant"].ask_stream(user_text):
+        if kind == "stage":
+            status.update(label=value.capitalize())
+            status.write(f"{value} ({time.time() - tic:.1f}s)")
+            continue
+        if first_token is None:
+            first_token = time.time() - tic
+        tokens.append(value)
+        answer.markdown("".join(tokens) + "▌")
+    total = time.time() - tic
+    status.update(label="Done", state="complete")
+    answer.empty()
+
+    first_token = total if first_token is None else first_token
+    st.session_state["latencies"].append((first_token, total))
+    st.caption(f"first token: {first_token:.1f}s, total: {total:.1f}s")
+    return "".join(tokens) or "NOT FOUND"
+
+
 def process_input():
     if (
         st.session_state["user_input"]
@@ -26,8 +58,8 @@ def process_input():
         if len(user_text) > MAX_QUERY_LENGTH:
             st.warning(f"Query too long. Maximum {MAX_QUERY_LENGTH} characters allowed.")
             return
-        with st.session_state["thinking_spinner"], st.spinner(f"Thinking"):
-            agent_text = st.session_state["assistant"].ask(user_text)
+        with st.session_state["thinking_spinner"].container():
+            agent_text = stream_answer(user_text)
 
         st.session_state["messages"].append((user_text, True))
         st.session_state["messages"].append((agent_text, False))
@@ -37,15 +69,18 @@ MAX_FILE_SIZE_MB = 50
 
 
 def read_and_save_file():
-    st.session_state["assistant"].clear()
-    st.session_state["messages"] = []
     st.session_state["user_input"] = ""
 
+    # files already handled by this session are skipped without being read;
+    # files ingested by any session are skipped by md5
     for file in st.session_state["file_uploader"]:
         if file.size > MAX_FILE_SIZE_MB * 1024 * 1024:
             st.error(f"File '{file.name}' exceeds {MAX_FILE_SIZE_MB}MB limit. Skipping.")
             continue
+        if file.file_id in st.session_state["ingested"]:
+            continue
 
+        md5 = md5sum(data=file.getbuffer())
         with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tf:
             tf.write(file.getbuffer())
             file_path = tf.name
@@ -53,13 +88,28 @@ def read_and_save_file():
         with st.session_state["ingestion_spinner"], st.spinner(
             f"Ingesting {file.name}"
         ):
-            st.session_state["assistant"].ingest(file_path)
+            count = st.session_state["assistant"].ingest(
+                file_path, name=file.name, md5=md5
+            )
         os.remove(file_path)
+        st.session_state["ingested"].add(file.file_id)
+        if not count:
+            st.info(f"'{file.name}' was already ingested.")
+
+
+@st.cache_resource
+def warm_pool():
+    # runs once per process; later sessions reuse the warm graph and chain
+    pool.warm()
+    return pool
 
 
 def page():
+    warm_pool()
     if len(st.session_state) == 0:
         st.session_state["messages"] = []
+        st.session_state["latencies"] = []
+        st.session_state["ingested"] = set()
         st.session_state["assistant"] = ChatPDF()
 
     st.header("ChatPDF")
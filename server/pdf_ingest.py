@@ -0,0 +1,120 @@
+import hashlib
+import threading
+from itertools import islice
+
+from langchain.document_loaders import PyPDFLoader
+from langchain.vectorstores.neo4j_vector import Neo4jVector
+from langchain.vectorstores.utils import filter_complex_metadata
+
+
+def md5sum(path=None, data=None, block_size=1 << 20):
+    """md5 of a file or of its bytes, as in the ``md5sum`` column of catalog.csv."""
+    h = hashlib.md5()
+    if data is not None:
+        h.update(data)
+        return h.hexdigest()
+    with open(path, "rb") as fd:
+        for block in iter(lambda: fd.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class PdfIngestor:
+    """Incremental PDF ingestion into a Neo4j vector index.
+
+    Pages are read one at a time, split, and embedded and written in batches
+    of ``batch_size`` chunks. Chunk ids are derived from the file md5, so an
+    interrupted ingestion is overwritten when retried. A ``(:Document
+    {md5sum})`` node is written once all the chunks of a file are in, and
+    files whose md5 already has one are skipped.
+
+    Args:
+        embeddings: The embedding model.
+        url: Neo4j URL.
+        username: Neo4j user.
+        password: Neo4j password.
+        text_splitter: Splitter applied to each page.
+        batch_size: Number of chunks embedded and written at once.
+    """
+
+    def __init__(self, embeddings, url, username, password, text_splitter, batch_size=64):
+        self.embeddings = embeddings
+        self.url = url
+        self.username = username
+        self.password = password
+        self.text_splitter = text_splitter
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self._store = None
+
+    @property
+    def store(self):
+        # connected on first use, then shared by all the sessions
+        with self.lock:
+            if self._store is None:
+                store = Neo4jVector(
+                    embedding=self.embeddings,
+                    url=self.url,
+                    username=self.username,
+                    password=self.password,
+                )
+                if store.retrieve_existing_index() is None:
+                    store.create_new_index()
+                store.query(
+                    "CREATE CONSTRAINT IF NOT EXISTS FOR (d:Document) "
+                    "REQUIRE d.md5sum IS UNIQUE"
+                )
+                self._store = store
+            return self._store
+
+    def is_ingested(self, md5):
+        rows = self.store.query(
+            "MATCH (d:Document {md5sum: $md5}) RETURN count(d) AS count",
+            params={"md5": md5},
+        )
+        return rows[0]["count"] > 0
+
+    def _chunks(self, path, md5):
+        for page in PyPDFLoader(file_path=path).lazy_load():
+            for chunk in self.text_splitter.split_documents([page]):
+                chunk.metadata["md5sum"] = md5
+                yield chunk
+
+    def ingest(self, path, name=None, md5=None):
+        """Ingests a PDF, unless a file with the same md5 already was.
+
+        Args:
+            path: Path to the PDF.
+            name: Name recorded on the Document node, defaults to ``path``.
+            md5: md5 of the file, computed if not given.
+
+        Returns:
+            The number of chunks written, 0 for a skipped file.
+        """
+        md5 = md5 or md5sum(path)
+        if self.is_ingested(md5):
+            return 0
+
+        count = 0
+        for batch in batched(self._chunks(path, md5), self.batch_size):
+            batch = filter_complex_metadata(batch)
+            texts = [chunk.page_content for chunk in batch]
+            self.store.add_embeddings(
+                texts,
+                self.embeddings.embed_documents(texts),
+                metadatas=[chunk.metadata for chunk in batch],
+                ids=[f"{md5}__{count + i}" for i in range(len(batch))],
+            )
+            count += len(batch)
+
+        self.store.query(
+            "MERGE (d:Document {md5sum: $md5}) SET d.name = $name, d.chunks = $count",
+            params={"md5": md5, "name": name or str(path), "count": count},
+        )
+        return count
@@ -1,5 +1,6 @@
 import os
 import re
+import sys
 import json
 import neo4j
 import pydantic
@@ -20,7 +21,6 @@ from langchain.graphs.graph_document import (
 from langchain.chains.openai_functions import (
     create_structured_output_chain,
 )
-from langchain.chains import GraphCypherQAChain
 from langchain.pydantic_v1 import Field, BaseModel
 from langchain.document_loaders import PyPDFLoader
 from langchain.schema.runnable import RunnablePassthrough
@@ -32,6 +32,14 @@ from langchain.vectorstores.neo4j_vector import Neo4jVector
 from langchain.chains import create_extraction_chain_pydantic
 from langchain.vectorstores.utils import filter_complex_metadata
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from answer_cache import AnswerCache
+from resource_pool import ResourcePool
+from pdf_ingest import PdfIngestor
+
+# the Cypher cache is shared with the evaluation scripts of the parent directory
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from cypher_cache import CypherCache, CachedGraphCypherQAChain
+from schema_cache import with_schema_cache
 
 
 # embeddings = SentenceTransformerEmbeddings(model_name="all-MiniLM-L6-v2")
@@ -42,19 +50,67 @@ neo4j_username = os.environ.get("NEO4J_USERNAME", "neo4j")
 neo4j_password = os.environ.get("NEO4J_PASSWORD")
 if not neo4j_password:
     raise EnvironmentError("NEO4J_PASSWORD environment variable is required.")
-graph = Neo4jGraph(url=neo4j_url, username=neo4j_username, password=neo4j_password)
+
+# built once per process and shared by all the sessions
+chat_model = ChatOllama(model="mistral")
+qa_model = ChatOllama(model="mistral", temperature=0.0)
+cypher_model = ChatOpenAI(model="gpt-4", temperature=0.0)
+cypher_cache = CypherCache(os.environ.get("CYPHER_CACHE", "cypher_cache.sqlite"))
+
+
+def build_graph():
+    return with_schema_cache(Neo4jGraph)(
+        url=neo4j_url, username=neo4j_username, password=neo4j_password
+    )
+
+
+def build_chain(graph):
+    return CachedGraphCypherQAChain.from_llm(
+        graph=graph,
+        cypher_llm=cypher_model,
+        qa_llm=qa_model,
+        validate_cypher=True,
+        verbose=True,
+        cypher_cache=cypher_cache,
+        cache_scope=neo4j_url,
+    )
+
+
+pool = ResourcePool(build_graph, build_chain)
+ingestor = PdfIngestor(
+    embeddings,
+    neo4j_url,
+    neo4j_username,
+    neo4j_password,
+    RecursiveCharacterTextSplitter(chunk_size=1024, chunk_overlap=100),
+)
+
+
+def graph_version():
+    # node and relationship counts come from the count store, so this is cheap
+    graph = pool.graph()
+    nodes = graph.query("MATCH (n) RETURN count(n) AS count")[0]["count"]
+    rels = graph.query("MATCH ()-[r]->() RETURN count(r) AS count")[0]["count"]
+    return nodes, rels
+
+
+# shared by all the sessions of the process; similar questions share an
+# answer only if ANSWER_CACHE_THRESHOLD (a cosine similarity) is set
+answer_threshold = os.environ.get("ANSWER_CACHE_THRESHOLD")
+answer_cache = AnswerCache(
+    embed=embeddings.embed_query,
+    threshold=float(answer_threshold) if answer_threshold else None,
+    version=graph_version,
+)
 
 
 class ChatPDF:
     vector_store = None
     retriever = None
-    chain = None
 
     def __init__(self):
-        self.model = ChatOllama(model="mistral")
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1024, chunk_overlap=100
-        )
+        self.model = chat_model
+        self.text_splitter = ingestor.text_splitter
         self.prompt = PromptTemplate.from_template(
             """
             <s> [INST] You are an assistant for question-answering tasks. Use the following pieces of retrieved context 
@@ -66,58 +122,74 @@ class ChatPDF:
             """
         )
 
-    def ingest(self, pdf_file_path: str):
-        # print("ingesting: ", pdf_file_path)
-        # docs = PyPDFLoader(file_path=pdf_file_path).load()
-        # chunks = self.text_splitter.split_documents(docs)
-        # chunks = filter_complex_metadata(chunks)
-
-        # vector_store = Neo4jVector.from_documents(
-        #     # chunks,
-        #     docs,
-        #     embeddings,
-        #     url=neo4j_url,
-        #     username=neo4j_username,
-        #     password=neo4j_password,
-        # )
-
-        # self.retriever = vector_store.as_retriever(
-        #     search_type="similarity_score_threshold",
-        #     search_kwargs={"k": 3, "score_threshold": 0.5},
-        # )
-        # # json_parser = SimpleJsonOutputParser()
-
-        # self.retriever = vector_store.as_retriever(
-        #     search_type="similarity_score_threshold",
-        #     search_kwargs={
-        #         "k": 3,
-        #         "score_threshold": 0.5,
-        #     },
-        # )
-
-        # self.chain = ({"context": self.retriever, "question": RunnablePassthrough()}
-        #               | self.prompt
-        #               | self.model
-        #               | StrOutputParser())
-        qa_model = ChatOllama(model="mistral", temperature=0.0)
-        cypher_model = ChatOpenAI(model="gpt-4", temperature=0.0)
-
-        self.chain = GraphCypherQAChain.from_llm(
-            graph=graph,
-            cypher_llm=cypher_model,
-            qa_llm=qa_model,
-            validate_cypher=True,
-            verbose=True,
+    def ingest(self, pdf_file_path: str, name=None, md5=None):
+        """Ingests a PDF into the shared vector index.
+
+        Returns:
+            The number of chunks written, 0 if the file was already ingested.
+        """
+        count = ingestor.ingest(pdf_file_path, name=name, md5=md5)
+        self.vector_store = ingestor.store
+        self.retriever = self.vector_store.as_retriever(
+            search_type="similarity_score_threshold",
+            search_kwargs={"k": 3, "score_threshold": 0.5},
         )
+        return count
+
+    @property
+    def chain(self):
+        return pool.chain()
 
     def ask(self, query: str):
         # if not self.chain:
         #     return "Please, add a PDF document first."
         print("chain: ", self.chain)
-        qa = self.chain.invoke(query)
-        return qa.get("result", "NOT FOUND")
+        return answer_cache.get_or_compute(
+            query,
+            lambda: pool.call(lambda chain: chain.invoke(query)).get(
+                "result", "NOT FOUND"
+            ),
+        )
+
+    def ask_stream(self, query: str):
+        """Streaming counterpart of ``ask``.
+
+        Yields:
+            ``("stage", name)`` and ``("token", text)`` tuples (see
+            ``CachedGraphCypherQAChain.iter_answer``). A cached answer, or
+            the answer of the same question asked meanwhile by another
+            session, is yielded as a single token.
+        """
+        answer, future = answer_cache.claim(query)
+        if answer is not None:
+            yield "stage", "cached answer"
+            yield "token", answer
+            return
+        if future is not None:
+            yield "stage", "waiting for the same question"
+            yield "token", future.result()
+            return
+
+        tokens = []
+        try:
+            # stages are shown again if the chain is retried after a lost
+            # connection, tokens can't be
+            for kind, value in pool.stream(
+                lambda chain: chain.iter_answer(query),
+                replayable=lambda item: item[0] == "stage",
+            ):
+                if kind == "token":
+                    tokens.append(value)
+                yield kind, value
+        except GeneratorExit:
+            # the session stopped reading, e.g. the page was reloaded
+            answer_cache.release(query, error=RuntimeError("answer stream closed"))
+            raise
+        except BaseException as e:
+            answer_cache.release(query, error=e)
+            raise
+        answer_cache.release(query, "".join(tokens) or "NOT FOUND")
 
     def clear(self):
         self.vector_store = None
         self.retriever = None
-        self.chain = None
@@ -0,0 +1,115 @@
+import time
+import threading
+from neo4j import exceptions
+
+
+# errors after which the connection is rebuilt and the call retried once
+RECONNECT_ON = (exceptions.ServiceUnavailable, exceptions.SessionExpired)
+
+
+class ResourcePool:
+    """Process-wide graph connection and QA chain, shared by all the sessions.
+
+    The graph and the chain are built once, on ``warm`` or on first use, and
+    handed out to every session. The connection is health-checked at most
+    every ``check_interval`` seconds when handed out, and both are rebuilt
+    when the check or a call fails with ``ServiceUnavailable`` or
+    ``SessionExpired``.
+
+    Args:
+        build_graph: Function returning a new graph connection.
+        build_chain: Function returning a new chain for a graph.
+        check_interval: Minimum delay between health checks, in seconds.
+    """
+
+    def __init__(self, build_graph, build_chain, check_interval=30):
+        self.build_graph = build_graph
+        self.build_chain = build_chain
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self._graph = None
+        self._chain = None
+        self.checked = 0.0
+        self.reconnects = 0
+
+    def _build(self):
+        # called with the lock held
+        self._graph = self.build_graph()
+        self._chain = self.build_chain(self._graph)
+        self.checked = time.monotonic()
+
+    def warm(self):
+        """Builds the graph and the chain, if not built yet."""
+        with self.lock:
+            if self._chain is None:
+                self._build()
+
+    def reconnect(self, stale=None):
+        """Rebuilds the graph and the chain.
+
+        Args:
+            stale: The chain that failed. If another thread has already
+                replaced it, nothing is rebuilt.
+        """
+        with self.lock:
+            if stale is not None and stale is not self._chain:
+                return
+            self._build()
+            self.reconnects += 1
+
+    def healthy(self):
+        try:
+            self._graph.query("RETURN 1")
+            return True
+        except RECONNECT_ON:
+            return False
+
+    def _get(self):
+        self.warm()
+        with self.lock:
+            graph, chain = self._graph, self._chain
+            due = time.monotonic() - self.checked >= self.check_interval
+            if due:
+                self.checked = time.monotonic()
+        if due and not self.healthy():
+            self.reconnect(chain)
+            with self.lock:
+                graph, chain = self._graph, self._chain
+        return graph, chain
+
+    def graph(self):
+        return self._get()[0]
+
+    def chain(self):
+        return self._get()[1]
+
+    def call(self, fn):
+        """Calls ``fn(chain)``, reconnecting and retrying once on a lost connection."""
+        chain = self.chain()
+        try:
+            return fn(chain)
+        except RECONNECT_ON:
+            self.reconnect(chain)
+            return fn(self.chain())
+
+    def stream(self, fn, replayable=lambda item: False):
+        """Iterates over ``fn(chain)``, reconnecting and retrying once on a lost
+        connection, unless an item that can't be yielded twice was.
+
+        Args:
+            fn: Function of the chain returning an iterator.
+            replayable: Predicate of the items the retry may yield again,
+                e.g. progress notices.
+        """
+        chain = self.chain()
+        committed = False
+        try:
+            for item in fn(chain):
+                committed = committed or not replayable(item)
+                yield item
+            return
+        except RECONNECT_ON:
+            if committed:
+                raise
+            self.reconnect(chain)
+        yield from fn(self.chain())
@@ -0,0 +1,132 @@
+import os
+import time
+import itertools
+import pandas as pd
+from tqdm import tqdm
+from pathlib import Path
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+
+def grid(**axes):
+    """Configurations of a parameter grid, in ``itertools.product`` order.
+
+    Example:
+        ``grid(chunk_size=[512, 1024], overlap=[0, 24])`` returns four dicts
+        with ``chunk_size`` and ``overlap`` keys.
+    """
+    names = list(axes)
+    return [dict(zip(names, values)) for values in itertools.product(*axes.values())]
+
+
+def _run(fn, config):
+    started, cpu = time.perf_counter(), time.process_time()
+    try:
+        stats, error = fn(config) or {}, None
+    except Exception as e:
+        stats, error = {}, repr(e)
+    return {
+        "seconds": time.perf_counter() - started,
+        "cpu_seconds": time.process_time() - cpu,
+        "pid": os.getpid(),
+        "error": error,
+        **stats,
+    }
+
+
+def _done(report, configs):
+    # rows of the configurations a previous run finished without error
+    if report is None or not Path(report).exists() or not configs:
+        return []
+    previous = pd.read_csv(report)
+    if "error" not in previous:
+        return []
+    names = list(configs[0])
+    keys = {tuple(c[n] for n in names) for c in configs}
+    rows = previous[previous["error"].isna()].to_dict("records")
+    return [r for r in rows if tuple(r.get(n) for n in names) in keys]
+
+
+def run_sweep(
+    fn,
+    configs,
+    processes=None,
+    initializer=None,
+    initargs=(),
+    chain=None,
+    cost=None,
+    report=None,
+    mp_context=None,
+):
+    """Runs every configuration of a parameter sweep in a process pool.
+
+    Shared inputs are computed once by the caller and handed to each worker
+    through ``initializer``. Configurations with the same ``chain`` key run
+    one after the other, in the order given, so the later ones reuse what
+    the earlier ones cached; different chains run in parallel, the most
+    costly first. Each finished configuration is appended to ``report``
+    with its wall and CPU time, and configurations already recorded there
+    without error are skipped, so an interrupted sweep can be resumed.
+
+    Args:
+        fn: Picklable function of a configuration, returning a dict of
+            statistics (or None).
+        configs: List of configuration dicts, e.g. from ``grid``.
+        processes: Number of worker processes. With 1, configurations run in
+            this process.
+        initializer: Called with ``initargs`` once in every worker.
+        initargs: Arguments of ``initializer``.
+        chain: Function of a configuration returning its chain key.
+        cost: Function of a configuration returning its estimated cost, also
+            written to the report.
+        report: CSV file of the per-configuration results.
+        mp_context: Multiprocessing context of the pool.
+
+    Returns:
+        The rows of the report, one dict per configuration.
+    """
+    rows = _done(report, configs)
+    names = list(configs[0]) if configs else []
+    finished = {tuple(r[n] for n in names) for r in rows}
+    pending = [c for c in configs if tuple(c[n] for n in names) not in finished]
+
+    chains = {}
+    for config in pending:
+        key = chain(config) if chain else len(chains)
+        chains.setdefault(key, []).append(config)
+    # longest chains first, so the sweep doesn't end waiting on one of them
+    order = sorted(
+        chains.values(), key=lambda c: -sum(map(cost, c)) if cost else 0
+    )
+
+    def record(config, result):
+        row = {**config, **({"cost": cost(config)} if cost else {}), **result}
+        rows.append(row)
+        if report is not None:
+            pd.DataFrame(rows).to_csv(report, index=None)
+        status = result["error"] or f"{result['seconds']:.1f}s"
+        tqdm.write(f"{config}: {status}")
+
+    with tqdm(total=len(configs), initial=len(configs) - len(pending)) as pbar:
+        if processes == 1:
+            if initializer is not None:
+                initializer(*initargs)
+            for config in itertools.chain.from_iterable(order):
+                record(config, _run(fn, config))
+                pbar.update(1)
+            return rows
+
+        with ProcessPoolExecutor(processes, mp_context, initializer, initargs) as pool:
+            running = {}
+            for rest in order:
+                config = rest.pop(0)
+                running[pool.submit(_run, fn, config)] = (config, rest)
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    config, rest = running.pop(future)
+                    record(config, future.result())
+                    pbar.update(1)
+                    if rest:
+                        config = rest.pop(0)
+                        running[pool.submit(_run, fn, config)] = (config, rest)
+    return rows
@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# the modules live at the top of the repository, the app's in server/
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "server"))
@@ -0,0 +1,59 @@
+import numpy as np
+
+from ann_index import IVFIndex
+
+
+def clustered(n, dim=64, clusters=200, noise=0.5, seed=0):
+    # embeddings of related triplets lie close together
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    return centers[rng.integers(clusters, size=n)] + noise * rng.normal(size=(n, dim))
+
+
+def test_small_index_is_searched_exhaustively(tmp_path):
+    ann = IVFIndex(tmp_path, min_train=100)
+    vectors = clustered(50)
+    ann.add([str(i) for i in range(50)], vectors)
+    assert ann.centroids is None
+    assert ann.recall(k=10) == 1.0
+    assert "7" in ann.search(vectors[7], 1)
+
+
+def test_nprobe_is_tuned_to_the_target_recall(tmp_path):
+    # overlapping clusters, on which 8 of the 141 centroids recall about half
+    ann = IVFIndex(tmp_path, nprobe=8, target_recall=0.95)
+    vectors = clustered(20000, clusters=5000, noise=1.0)
+    for start in range(0, len(vectors), 1000):
+        rows = range(start, start + 1000)
+        ann.add([str(i) for i in rows], vectors[start : start + 1000])
+    assert ann.centroids is not None
+    assert 8 < ann.nprobe < len(ann.centroids)
+    assert ann.recall(k=10) >= 0.95
+
+    ann.save()
+    assert IVFIndex(tmp_path).nprobe == ann.nprobe
+
+
+def test_add_skips_indexed_texts_and_survives_reload(tmp_path):
+    ann = IVFIndex(tmp_path)
+    vectors = clustered(10)
+    ann.add(["a", "b"], vectors[:2])
+    ann.add(["b", "c"], vectors[1:3])
+    ann.save()
+    ann.add(["d"], vectors[3:4])  # not saved
+    reloaded = IVFIndex(tmp_path)
+    assert reloaded.texts == ["a", "b", "c"]
+
+
+def test_ann_query_engine_retriever_matches_the_stock_one(tmp_path):
+    from llama_index.core import KnowledgeGraphIndex
+    from llama_index.core.embeddings import MockEmbedding
+    from llama_index.core.llms.mock import MockLLM
+
+    from ann_index import as_ann_query_engine
+
+    index = KnowledgeGraphIndex([], llm=MockLLM(), embed_model=MockEmbedding(embed_dim=8))
+    index._object_map = {"node": object()}
+    engine = as_ann_query_engine(index, IVFIndex(tmp_path), llm=MockLLM())
+    stock = index.as_retriever()
+    assert engine.retriever.object_map == stock.object_map == index._object_map
@@ -0,0 +1,89 @@
+import re
+import threading
+import numpy as np
+from collections import Counter
+
+from answer_cache import AnswerCache
+
+DEFICIENCY = "What is vitamin D deficiency?"
+INSUFFICIENCY = "what is vitamin d insufficiency?"
+
+
+def bag_of_words(query):
+    # sentence embeddings put these questions about as close as this does
+    words = Counter(re.findall(r"\w+", query.lower()))
+    vocabulary = sorted(set(re.findall(r"\w+", (DEFICIENCY + " " + INSUFFICIENCY).lower())))
+    return np.array([words[w] for w in vocabulary], dtype=np.float32)
+
+
+def cosine(a, b):
+    a, b = bag_of_words(a), bag_of_words(b)
+    return float(a @ b / np.linalg.norm(a) / np.linalg.norm(b))
+
+
+def test_similar_clinical_questions_do_not_collide():
+    assert cosine(DEFICIENCY, INSUFFICIENCY) > 0.75
+    cache = AnswerCache(embed=bag_of_words)
+    cache.put(DEFICIENCY, "deficiency answer")
+
+    assert cache.get(INSUFFICIENCY) == (None, None)
+    calls = []
+    answer = cache.get_or_compute(INSUFFICIENCY, lambda: calls.append(1) or "insufficiency answer")
+    assert answer == "insufficiency answer" and calls == [1]
+    assert cache.get(DEFICIENCY)[0] == "deficiency answer"
+
+
+def test_exact_match_ignores_case_and_spaces():
+    cache = AnswerCache(embed=bag_of_words)
+    cache.put(DEFICIENCY, "deficiency answer")
+    assert cache.get("  what is  vitamin d DEFICIENCY?")[0] == "deficiency answer"
+
+
+def test_semantic_matching_is_opt_in():
+    cache = AnswerCache(embed=bag_of_words, threshold=0.75)
+    cache.put(DEFICIENCY, "deficiency answer")
+    assert cache.get(INSUFFICIENCY)[0] == "deficiency answer"
+
+
+def test_concurrent_misses_compute_once():
+    cache = AnswerCache()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return "answer"
+
+    answers = []
+    owner = threading.Thread(target=lambda: answers.append(cache.get_or_compute(DEFICIENCY, compute)))
+    owner.start()
+    started.wait()
+    follower = threading.Thread(target=lambda: answers.append(cache.get_or_compute(DEFICIENCY, compute)))
+    follower.start()
+    release.set()
+    owner.join()
+    follower.join()
+    assert answers == ["answer", "answer"] and calls == [1]
+
+
+def test_claim_hands_the_owners_answer_to_followers():
+    cache = AnswerCache()
+    assert cache.claim(DEFICIENCY) == (None, None)
+    answer, future = cache.claim(DEFICIENCY.upper())
+    assert answer is None and not future.done()
+
+    cache.release(DEFICIENCY, "answer")
+    assert future.result() == "answer"
+    assert cache.claim(DEFICIENCY) == ("answer", None)
+
+
+def test_failed_claim_is_not_cached():
+    cache = AnswerCache()
+    cache.claim(DEFICIENCY)
+    _, future = cache.claim(DEFICIENCY)
+    cache.release(DEFICIENCY, error=RuntimeError("answer stream closed"))
+
+    assert isinstance(future.exception(), RuntimeError)
+    assert cache.claim(DEFICIENCY) == (None, None)
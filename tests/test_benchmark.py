@@ -0,0 +1,54 @@
+import time
+
+from benchmark import run_benchmark
+
+
+class Engine:
+    def __init__(self, delay):
+        self.delay = delay
+
+    def query(self, question):
+        time.sleep(self.delay)
+        return f"answer to {question}"
+
+
+class Flaky(Engine):
+    def __init__(self, delay):
+        super().__init__(delay)
+        self.failed = set()
+
+    def query(self, question):
+        if question not in self.failed:
+            self.failed.add(question)
+            raise TimeoutError(question)
+        return super().query(question)
+
+
+def slow_limiter(fn, *args):
+    # waits for a token, then retries failed attempts after a backoff
+    time.sleep(0.05)
+    for attempt in range(3):
+        try:
+            return fn(*args)
+        except TimeoutError:
+            time.sleep(0.05)
+    raise TimeoutError()
+
+
+def test_latency_excludes_limiter_waits_and_retries():
+    results, summary = run_benchmark(
+        {("db", "flaky"): Flaky(0.01)}, ["a", "b", "c"], warmup=0, call=slow_limiter
+    )
+    assert all(r["error"] is None for r in results)
+    assert all(r["time"] < 0.04 for r in results)
+    assert all(r["retries"] == 1 for r in results)
+    assert all(r["wait"] >= 0.09 for r in results)
+    assert summary.loc[0, "retries"] == 3
+    assert summary.loc[0, "p99"] < 0.04
+
+
+def test_warmup_questions_are_answered_but_not_timed():
+    results, summary = run_benchmark({("db", "s"): Engine(0)}, ["a", "b", "c"], warmup=1)
+    assert [r["question"] for r in results] == ["a", "b", "c"]
+    assert [r["warm"] for r in results] == [True, False, False]
+    assert summary.loc[0, "timed"] == 2
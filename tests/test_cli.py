@@ -0,0 +1,33 @@
+import cli
+from sweep import grid
+
+
+def test_sweep_defaults_to_the_whole_corpus(monkeypatch):
+    parsed = []
+    monkeypatch.setattr(cli, "sweep", parsed.append)
+    cli.main(["sweep", "--db-id", "db", "--chunk-size", "512", "--overlap", "0", "--max-triplets", "5"])
+    assert parsed[0].START is None and parsed[0].STOP is None
+
+
+def test_sweep_configurations_are_isolated():
+    configs = grid(chunk_size=[512, 1024], overlap=[0, 50], max_triplets=[10, 5])
+    configs = cli.assign_urls(configs, ["bolt://a", "bolt://b"], lambda c: c["chunk_size"])
+
+    # a (chunk size, overlap) pair stays on one database, and the work is split
+    by_pair = {}
+    for config in configs:
+        by_pair.setdefault((config["chunk_size"], config["overlap"]), set()).add(config["url"])
+    assert all(len(urls) == 1 for urls in by_pair.values())
+    assert {c["url"] for c in configs} == {"bolt://a", "bolt://b"}
+
+    labels = {
+        cli.sweep_label(f"exp_overlap_{c['overlap']}", c) for c in configs
+    }
+    assert len(labels) == len(configs)
+    assert all(label.isidentifier() for label in labels)
+
+
+def test_sweep_gives_each_configuration_a_database_when_it_can():
+    configs = grid(chunk_size=[512], overlap=[0], max_triplets=[10, 5])
+    configs = cli.assign_urls(configs, ["bolt://a", "bolt://b"], lambda c: c["chunk_size"])
+    assert [c["url"] for c in configs] == ["bolt://a", "bolt://b"]
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import corpus_store
+from corpus_store import open_corpus
+from utils import iter_dataset_overlap
+
+
+def random_corpus(path, files=20, seed=0):
+    rng = np.random.default_rng(seed)
+    words = ["vitamin", "d", "covid", "serum", "deficiency", "sun", "é", "\n"]
+    rows = []
+    for f in range(files):
+        for _ in range(rng.integers(1, 30)):
+            length = rng.integers(1, 40)
+            rows.append({"fname": f"file_{f:02d}.pdf", "text": " ".join(rng.choice(words, length))})
+    # a repeated row makes duplicate chunks
+    rows.append(dict(rows[-1]))
+    pd.DataFrame(rows).to_csv(path, index=False)
+
+
+@pytest.mark.parametrize("chunk_size, overlap", [(64, 0), (256, 1), (1024, 3)])
+def test_overlap_documents_match_iter_dataset_overlap(tmp_path, chunk_size, overlap):
+    csv = tmp_path / "corpus.csv"
+    random_corpus(csv)
+    store = open_corpus(csv)
+
+    expected = list(iter_dataset_overlap(csv, chunk_size, overlap, batch_size=7))
+    for _ in range(2):  # computed, then read from the chunk set
+        docs = list(store.overlap_documents(chunk_size, overlap))
+        assert [d.text for d in docs] == [d.text for d in expected]
+        assert [d.metadata for d in docs] == [
+            {k: int(v) if k != "source" else v for k, v in d.metadata.items()}
+            for d in expected
+        ]
+    store.close()
+
+
+def test_interrupted_build_leaves_no_store(tmp_path, monkeypatch):
+    csv = tmp_path / "corpus.csv"
+    random_corpus(csv)
+    save = np.save
+
+    def failing_save(file, arr, *args, **kwargs):
+        if str(file).endswith("offsets.npy"):
+            raise KeyboardInterrupt
+        return save(file, arr, *args, **kwargs)
+
+    monkeypatch.setattr(corpus_store.np, "save", failing_save)
+    with pytest.raises(KeyboardInterrupt):
+        open_corpus(csv)
+    monkeypatch.setattr(corpus_store.np, "save", save)
+
+    assert not (tmp_path / "corpus_store").exists()
+    store = open_corpus(csv)
+    assert len(store) == len(pd.read_csv(csv))
+    store.close()
@@ -0,0 +1,77 @@
+import pytest
+
+pytest.importorskip("langchain.chains.graph_qa.cypher")
+
+from langchain_community.graphs.graph_store import GraphStore
+from langchain_core.language_models import FakeListLLM
+
+from cypher_cache import CachedGraphCypherQAChain, CypherCache
+
+
+class Graph(GraphStore):
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.queries = []
+
+    @property
+    def get_schema(self):
+        return "Node properties: Entity {name: STRING}"
+
+    @property
+    def get_structured_schema(self):
+        return {"node_props": {}, "rel_props": {}, "relationships": []}
+
+    @property
+    def structured_schema(self):
+        return self.get_structured_schema
+
+    def query(self, query, params={}):
+        self.queries.append(query)
+        if self.fail:
+            raise ValueError("syntax error")
+        return [{"name": "vitamin d"}]
+
+    def refresh_schema(self):
+        pass
+
+    def add_graph_documents(self, graph_documents, include_source=False):
+        pass
+
+
+def make_chain(cache, graph, cypher):
+    return CachedGraphCypherQAChain.from_llm(
+        graph=graph,
+        cypher_llm=FakeListLLM(responses=cypher),
+        qa_llm=FakeListLLM(responses=["answer"] * 10),
+        validate_cypher=True,
+        return_intermediate_steps=True,
+        cypher_cache=cache,
+        cache_scope="bolt://a/Entity",
+    )
+
+
+QUERY = "MATCH (n:Entity) RETURN n.name AS name"
+
+
+def test_repeated_question_skips_the_cypher_llm(tmp_path):
+    cache = CypherCache(tmp_path / "cypher.sqlite")
+    graph = Graph()
+    chain = make_chain(cache, graph, [QUERY])
+
+    first = chain.invoke({"query": "What is vitamin D?"})
+    # FakeListLLM would loop back to its only response, so check it isn't used
+    chain.cypher_generation_chain.llm.responses = ["MATCH (x) RETURN x"]
+    second = chain.invoke({"query": "what is  vitamin d?"})
+
+    assert first["result"] == second["result"] == "answer"
+    assert graph.queries == [QUERY, QUERY]
+    assert second["intermediate_steps"][0] == {"query": QUERY}
+
+
+def test_failing_cypher_is_not_cached(tmp_path):
+    cache = CypherCache(tmp_path / "cypher.sqlite")
+    chain = make_chain(cache, Graph(fail=True), [QUERY])
+
+    with pytest.raises(ValueError):
+        chain.invoke({"query": "What is vitamin D?"})
+    assert cache.get("bolt://a/Entity", chain.graph_schema, "What is vitamin D?") is None
@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+
+from llama_index.core.base.response.schema import Response
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from evaluation import EvalCache, answer_contexts, evaluate_results
+
+
+class Evaluator:
+    def __init__(self):
+        self.calls = []
+
+    def evaluate(self, response, contexts):
+        self.calls.append((response, contexts))
+        return SimpleNamespace(score=1.0, passing=True, feedback="YES")
+
+
+def chain_output():
+    return {
+        "query": "what is vitamin d deficiency?",
+        "result": "A low serum level of vitamin D.",
+        "intermediate_steps": [
+            {"query": "MATCH (n) RETURN n.name AS name"},
+            {"context": [{"name": "vitamin d deficiency"}, {"name": "serum level"}]},
+        ],
+    }
+
+
+def test_answer_contexts_of_a_chain_output():
+    answer, contexts = answer_contexts(chain_output())
+    assert answer == "A low serum level of vitamin D."
+    assert contexts == ['{"name": "vitamin d deficiency"}', '{"name": "serum level"}']
+
+
+def test_answer_contexts_of_a_query_engine_response():
+    node = NodeWithScore(node=TextNode(text="vitamin d -> covid"), score=1.0)
+    answer, contexts = answer_contexts(Response(response="related", source_nodes=[node]))
+    assert answer == "related"
+    assert contexts == ["vitamin d -> covid"]
+
+
+def test_chain_answers_are_evaluated(tmp_path):
+    evaluator = Evaluator()
+    results = [{"response": chain_output(), "error": None}]
+    scores = evaluate_results(evaluator, "mock", results, cache=EvalCache(tmp_path / "e.sqlite"))
+    assert scores[0]["score"] == 1.0
+    assert evaluator.calls[0][0] == "A low serum level of vitamin D."
+    assert len(evaluator.calls[0][1]) == 2
@@ -0,0 +1,48 @@
+import pytest
+
+exceptions = pytest.importorskip("neo4j.exceptions")
+
+from resource_pool import ResourcePool
+
+
+class Chain:
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+
+    def iter_answer(self, question):
+        events = [("stage", "querying graph"), ("token", "a"), ("token", "b")]
+        for i, event in enumerate(events):
+            if i == self.fail_after:
+                raise exceptions.ServiceUnavailable("lost")
+            yield event
+
+
+def make_pool(*chains):
+    chains = list(chains)
+    return ResourcePool(lambda: object(), lambda graph: chains.pop(0))
+
+
+def stream(pool):
+    return list(
+        pool.stream(
+            lambda chain: chain.iter_answer("q"),
+            replayable=lambda item: item[0] == "stage",
+        )
+    )
+
+
+def test_stream_retries_before_the_first_token():
+    pool = make_pool(Chain(fail_after=1), Chain())
+    assert stream(pool) == [
+        ("stage", "querying graph"),
+        ("stage", "querying graph"),
+        ("token", "a"),
+        ("token", "b"),
+    ]
+    assert pool.reconnects == 1
+
+
+def test_stream_does_not_retry_after_a_token():
+    pool = make_pool(Chain(fail_after=2), Chain())
+    with pytest.raises(exceptions.ServiceUnavailable):
+        stream(pool)
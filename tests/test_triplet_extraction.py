@@ -0,0 +1,75 @@
+from llama_index.core import KnowledgeGraphIndex
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.llms.mock import MockLLM
+
+from RAGout import cached_triplets
+from triplet_cache import TripletCache
+
+
+class CountingLimiter:
+    def __init__(self):
+        self.calls = 0
+
+    def call(self, fn, *args, **kwargs):
+        self.calls += 1
+        return fn(*args, **kwargs)
+
+
+def make_index():
+    # MockLLM echoes the prompt, whose examples parse as triplets
+    return KnowledgeGraphIndex.from_documents(
+        [], llm=MockLLM(), embed_model=MockEmbedding(embed_dim=4), max_triplets_per_chunk=3
+    )
+
+
+def test_extracts_then_reads_from_cache(tmp_path):
+    index = make_index()
+    cache = TripletCache(tmp_path / "triplets.sqlite")
+    limiter = CountingLimiter()
+
+    first = cached_triplets(index, "vitamin d and covid", cache, limiter, "mock", 3)
+    assert first
+    assert all(len(t) == 3 for t in first)
+    assert limiter.calls == 1
+
+    second = cached_triplets(index, "vitamin d and covid", cache, limiter, "mock", 3)
+    assert second == first[:3]
+    assert limiter.calls == 1
+
+
+def test_smaller_limit_is_served_from_larger_extraction(tmp_path):
+    index = make_index()
+    cache = TripletCache(tmp_path / "triplets.sqlite")
+    limiter = CountingLimiter()
+
+    cached_triplets(index, "text", cache, limiter, "mock", 10)
+    fewer = cached_triplets(index, "text", cache, limiter, "mock", 2)
+    assert len(fewer) == 2
+    assert limiter.calls == 1
+
+
+def test_insert_extracts_from_transformed_nodes_in_order():
+    # build's triplet_extractor relies on kg_index.insert extracting from the
+    # nodes of run_transformations, in order, each content containing the
+    # node text
+    from llama_index.core import Settings
+    from llama_index.core.ingestion import run_transformations
+    from llama_index.core.schema import Document
+
+    seen = []
+    index = KnowledgeGraphIndex.from_documents(
+        [],
+        llm=MockLLM(),
+        embed_model=MockEmbedding(embed_dim=4),
+        kg_triplet_extract_fn=lambda text: seen.append(text) or [],
+    )
+    doc = Document(
+        text=" ".join(f"sentence {i} about vitamin d." for i in range(400)),
+        metadata={"source": "a.txt", "start": 0, "end": 10},
+    )
+    nodes = run_transformations([doc], Settings.transformations)
+    index.insert(doc)
+
+    assert len(nodes) > 1
+    assert len(seen) == len(nodes)
+    assert all(node.text in text for node, text in zip(nodes, seen))
@@ -0,0 +1,73 @@
+import json
+import sqlite3
+import threading
+from utils import hash_string
+
+
+class TripletCache:
+    """Persistent triplet extraction cache, shared across experiments.
+
+    Entries are keyed by the hash of the chunk text, the model name, the hash
+    of the extraction prompt template and the maximum number of triplets, so
+    runs that only differ by ``EXP_TAG`` or ``DB_ID`` reuse each other's
+    extractions. A request for ``max_triplets`` can also be served by the
+    smallest cached extraction made with a larger limit, keeping its first
+    ``max_triplets`` triplets.
+    """
+
+    def __init__(self, path="triplet_cache.sqlite"):
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS triplets ("
+                " chunk TEXT, model TEXT, prompt TEXT, max_triplets INTEGER,"
+                " triplets TEXT,"
+                " PRIMARY KEY (chunk, model, prompt, max_triplets))"
+            )
+
+    def get(self, text, model, prompt, max_triplets):
+        """Looks up the triplets extracted from a chunk.
+
+        Args:
+            text: The chunk text.
+            model: Name of the extraction model.
+            prompt: The extraction prompt template.
+            max_triplets: Maximum number of triplets per chunk.
+
+        Returns:
+            A list of ``(subject, relationship, object)`` tuples, or None on
+            a miss.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT triplets FROM triplets"
+                " WHERE chunk = ? AND model = ? AND prompt = ? AND max_triplets >= ?"
+                " ORDER BY max_triplets LIMIT 1",
+                (hash_string(text), model, hash_string(prompt), max_triplets),
+            ).fetchone()
+        if row is None:
+            return None
+        return [tuple(t) for t in json.loads(row[0])][:max_triplets]
+
+    def put(self, text, model, prompt, max_triplets, triplets):
+        """Stores the triplets extracted from a chunk.
+
+        Args:
+            text: The chunk text.
+            model: Name of the extraction model.
+            prompt: The extraction prompt template.
+            max_triplets: Maximum number of triplets per chunk.
+            triplets: The extracted triplets, in extraction order.
+        """
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO triplets VALUES (?, ?, ?, ?, ?)",
+                (
+                    hash_string(text),
+                    model,
+                    hash_string(prompt),
+                    max_triplets,
+                    json.dumps([list(t) for t in triplets]),
+                ),
+            )
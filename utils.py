@@ -1,7 +1,9 @@
 import time
 import hashlib
-import google.generativeai
-from neo4j import exceptions
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
 from llama_index.core.schema import Document
 
 
@@ -24,6 +26,31 @@ def hash_string(string):
     return h.hexdigest()
 
 
+def ordered_map(fn, items, max_in_flight):
+    """Maps a function over an iterable with a bounded thread pool.
+
+    Items are consumed lazily and at most ``max_in_flight`` calls are running
+    or waiting to be collected at any time, so slow I/O bound calls (LLM
+    requests) overlap without reading the whole input ahead.
+
+    Args:
+        fn: The function to apply.
+        items: An iterable of arguments.
+        max_in_flight: Maximum number of concurrent calls.
+
+    Yields:
+        The results of ``fn``, in the order of ``items``.
+    """
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        pending = deque()
+        for item in items:
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+            pending.append(pool.submit(fn, item))
+        while pending:
+            yield pending.popleft().result()
+
+
 def dataset(df, chunk_size):
 
     nodes = []
@@ -86,81 +113,169 @@ def dataset(df, chunk_size):
     return nodes
 
 
+def overlap_spans(labels, lengths, chunk_size, overlap):
+    """Finds the chunk boundaries of a single file.
+
+    A chunk is closed at the first row whose lowercased length would take the
+    accumulated chunk (rows joined by a single space) to ``chunk_size`` or
+    more. The accumulated length is read from a cumulative length array with
+    ``searchsorted``, so the file is never walked row by row.
+
+    Args:
+        labels: Sorted row labels (DataFrame index) of the file.
+        lengths: Lowercased text length of each row.
+        chunk_size: Maximum chunk length, in characters.
+        overlap: Number of row labels to step back when a chunk is closed.
+
+    Returns:
+        A list of ``(start, end, size)`` tuples, ``start`` and ``end`` being
+        inclusive row labels.
+    """
+    labels = np.asarray(labels, dtype=np.int64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    n = len(labels)
+    spans = []
+    if n == 0:
+        return spans
+
+    # cum[p] is the length of rows [0, p) and reach[p] the length of the
+    # space-joined rows [0, p], plus one, so every chunk is a difference
+    cum = np.concatenate(([0], np.cumsum(lengths)))
+    reach = cum[1:] + np.arange(n)
+
+    block_start = labels[0]
+    if lengths[0] >= chunk_size:
+        spans.append((block_start, labels[0], 0))
+        block_start = max(block_start, labels[0] - overlap)
+
+    origin = 0
+    while True:
+        threshold = chunk_size + reach[origin] - lengths[origin] + 1
+        p = max(int(np.searchsorted(reach, threshold, side="left")), origin + 1)
+        if p >= n:
+            break
+        size = cum[p] - cum[origin] + p - 1 - origin
+        spans.append((block_start, labels[p], size))
+        block_start = max(block_start, labels[p] - overlap)
+        origin = p
+
+    size = cum[n] - cum[origin] + n - 1 - origin
+    spans.append((block_start, labels[-1], size))
+    return [(int(s), int(e), int(z)) for s, e, z in spans]
+
+
+def file_overlap(f_name, f_content, chunk_size, overlap, hashes):
+    """Yields the overlapping chunk Documents of a single file.
+
+    Args:
+        f_name: Name of the source file.
+        f_content: Rows of the file, indexed by their corpus row label.
+        chunk_size: Maximum chunk length, in characters.
+        overlap: Number of rows shared by consecutive chunks.
+        hashes: Set of already emitted chunk hashes, updated in place.
+    """
+    labels = f_content.index.to_numpy()
+    texts = f_content["text"].tolist()
+    lengths = f_content["text"].str.lower().str.len().to_numpy()
+
+    for start, end, size in overlap_spans(labels, lengths, chunk_size, overlap):
+        lo = np.searchsorted(labels, start, side="left")
+        hi = np.searchsorted(labels, end, side="right")
+        text = "\n".join(texts[lo:hi])
+
+        hashed_value = hash_string(text)
+        if hashed_value in hashes:
+            print("duplicated: ", size, chunk_size)
+            continue
+        hashes.add(hashed_value)
+
+        metadata = {
+            "source": f_name,
+            "block_size": chunk_size,
+            "size": size,
+            "start": start,
+            "end": end,
+        }
+        yield Document(text=text.strip(), metadata=metadata)
+
+
 def dataset_overlap(df, chunk_size, overlap):
     nodes = []
-    hashes = []
+    hashes = set()
     files = df.groupby("fname")  # Assuming 'fname' is the filename column
 
     for f_name, f_content in files:
-        chunk = ""
-        block_start = f_content.index[0]
-        block_end = block_start
-        block_id = 0
-
-        while block_end <= f_content.index[-1]:
-            if block_end in f_content.index:
-                row = f_content.loc[block_end]
-                content = row.text.lower()
-                new_chunk_size = len(chunk) + len(content)
-
-                if new_chunk_size >= chunk_size:
-                    # Create metadata for the current chunk
-                    metadata = {
-                        "source": f_name,
-                        "block_size": chunk_size,
-                        "size": len(chunk),
-                        "start": block_start,
-                        "end": block_end,
-                    }
-
-                    # Collect the text for the current chunk
-                    df_content = df.loc[block_start:block_end]
-                    df_content = df_content[df_content["fname"] == f_name]["text"]
-                    text = "\n".join(df_content)
-
-                    hashed_value = hash_string(text)
-                    if hashed_value in hashes:
-                        print("duplicated at 1: ", new_chunk_size, chunk_size)
-                        # break
-                    else:
-                        hashes.append(hashed_value)
-                        nodes.append(Document(text=text.strip(), metadata=metadata))
-
-                    # Update the start for the next chunk, considering the overlap
-                    block_start = max(block_start, block_end - overlap)
-                    chunk = ""
-
-                # Add current content to chunk
-                chunk += " " + content if chunk else content
-
-            # Move to the next row
-            block_end += 1
-
-            # Special handling for the last chunk in the group
-            if block_end > f_content.index[-1] and chunk:
-                metadata = {
-                    "source": f_name,
-                    "block_size": chunk_size,
-                    "size": len(chunk),
-                    "start": block_start,
-                    "end": f_content.index[-1],
-                }
-                df_content = df.loc[block_start : f_content.index[-1]]
-                df_content = df_content[df_content["fname"] == f_name]["text"]
-                text = "\n".join(df_content)
-                hashed_value = hash_string(text)
-                if hashed_value in hashes:
-                    print("duplicated at 2: ", new_chunk_size, chunk_size)
-                    # break
-                else:
-                    hashes.append(hashed_value)
-                    # nodes.append({"text": text.strip(), "metadata": metadata})
-                    nodes.append(Document(text=text.strip(), metadata=metadata))
-                break
+        nodes.extend(file_overlap(f_name, f_content, chunk_size, overlap, hashes))
 
     return nodes
 
 
+def iter_files(path, batch_size=10_000):
+    """Reads a corpus CSV in bounded batches and yields it file by file.
+
+    Rows of a file are expected to be contiguous, as in ``corpus.csv``. Only
+    the current batch and the rows of the file still being read are held in
+    memory, and row labels are the same as with a plain ``pd.read_csv``.
+
+    Args:
+        path: Path to the corpus CSV (``fname`` and ``text`` columns).
+        batch_size: Number of rows read per batch.
+
+    Yields:
+        ``(fname, rows)`` tuples, in corpus order.
+    """
+    pending = None
+    for batch in pd.read_csv(path, chunksize=batch_size):
+        if pending is not None:
+            batch = pd.concat([pending, batch])
+        runs = batch["fname"].ne(batch["fname"].shift()).cumsum()
+        last_run = runs.iloc[-1]
+        done = runs != last_run
+        for _, f_content in batch[done].groupby(runs[done], sort=False):
+            yield f_content["fname"].iloc[0], f_content
+        pending = batch[runs == last_run]
+
+    if pending is not None and len(pending):
+        yield pending["fname"].iloc[0], pending
+
+
+def iter_dataset_overlap(path, chunk_size, overlap, batch_size=10_000):
+    """Streaming counterpart of ``dataset_overlap``.
+
+    Chunks are produced from ``corpus.csv`` one file at a time, so the first
+    Document is available as soon as its file has been read. For a corpus
+    sorted by ``fname`` the Documents are the same, in the same order, as
+    the ones returned by ``dataset_overlap``.
+
+    Args:
+        path: Path to the corpus CSV.
+        chunk_size: Maximum chunk length, in characters.
+        overlap: Number of rows shared by consecutive chunks.
+        batch_size: Number of rows read per batch.
+
+    Yields:
+        Chunk Documents.
+    """
+    hashes = set()
+    for f_name, f_content in iter_files(path, batch_size):
+        yield from file_overlap(f_name, f_content, chunk_size, overlap, hashes)
+
+
+def read_rows(path, start, end):
+    """Reads the ``text`` of rows ``[start, end)`` of a corpus CSV.
+
+    Args:
+        path: Path to the corpus CSV.
+        start: First row label.
+        end: Row label after the last one.
+
+    Returns:
+        A list of strings.
+    """
+    rows = pd.read_csv(path, skiprows=range(1, start + 1), nrows=max(end - start, 0))
+    return rows["text"].tolist()
+
+
 def dataset_whole(df):
 
     docs = []